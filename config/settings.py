@@ -61,10 +61,13 @@ class Settings(BaseSettings):
     # StatPearls Ingestion Configuration (TEST MODE)
     MAX_STATPEARLS_CHUNKS: int = 2000  # Hard limit for test mode
     MIN_CONTENT_LENGTH: int = 300
+    EMBEDDING_CACHE_PATH: Optional[str] = None  # On-disk chunk embedding cache for re-ingestion (e.g. "cache/statpearls_embeddings")
     
     # Retrieval Configuration
     TOP_K_RETRIEVAL: int = 25  # Increased for demo/recall
     SIMILARITY_THRESHOLD: float = 0.15  # Lowered for cross-domain retrieval
+    QUANTIZE_QUERY_EMBEDDINGS: bool = False  # Send int8 query vectors (needs match_statpearls_embeddings_q8)
+    HNSW_EF_SEARCH_TUNING: bool = False  # Per-query ef_search by criticality (needs ef_search RPC param)
     
     # API Configuration
     API_HOST: str = "0.0.0.0"
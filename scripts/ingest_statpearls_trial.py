@@ -16,7 +16,7 @@ from typing import List, Dict
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from config.settings import settings
-from utils.embeddings import BMRetrieverEmbeddings
+from utils.embeddings import SentenceTransformerEmbeddings
 from supabase import create_client, Client
 
 logging.basicConfig(
@@ -32,7 +32,8 @@ class StatPearlsJSONLIngester:
     
     def __init__(self, chunk_dir: str = "chunk"):
         self.chunk_dir = Path(chunk_dir)
-        self.embeddings = BMRetrieverEmbeddings()
+        # Re-ingesting unchanged chunks reuses cached vectors when EMBEDDING_CACHE_PATH is set
+        self.embeddings = SentenceTransformerEmbeddings(cache_path=settings.EMBEDDING_CACHE_PATH)
         
         # Initialize Supabase client
         self.supabase: Client = create_client(
@@ -147,15 +148,11 @@ class StatPearlsJSONLIngester:
                     logger.warning(f"Empty content for chunk {idx}, skipping")
                     continue
                 
-                # Generate embedding
-                logger.debug(f"Embedding chunk {idx}/{total_chunks}...")
-                embedding = self.embeddings.embed_query(content)
-                
-                prepared['embedding'] = embedding
                 batch_chunks.append(prepared)
                 
-                # Process batch when full
+                # Embed and insert batch when full
                 if len(batch_chunks) >= batch_size:
+                    self._embed_batch(batch_chunks)
                     self._insert_batch(batch_chunks)
                     chunks_ingested += len(batch_chunks)
                     
@@ -177,6 +174,7 @@ class StatPearlsJSONLIngester:
         
         # Process remaining batch
         if batch_chunks:
+            self._embed_batch(batch_chunks)
             self._insert_batch(batch_chunks)
             chunks_ingested += len(batch_chunks)
         
@@ -191,6 +189,12 @@ class StatPearlsJSONLIngester:
         logger.info(f"Average rate: {chunks_ingested/elapsed_time:.1f} chunks/sec")
         logger.info("="*80)
     
+    def _embed_batch(self, chunks: List[Dict]):
+        """Embed a batch of prepared chunks in one encode call"""
+        embeddings = self.embeddings.embed_documents_list([chunk['content'] for chunk in chunks])
+        for chunk, embedding in zip(chunks, embeddings):
+            chunk['embedding'] = embedding
+    
     def _insert_batch(self, chunks: List[Dict]):
         """Insert batch into Supabase"""
         try:
@@ -38,7 +38,7 @@ from utils.clinical_intelligence import (
 from services.query_expander import MedicalQueryExpander
 from services.reranker import EvidenceReranker
 from services.llm_grader import LLMEvidenceGrader
-from services.risk_calculator import ClinicalRiskCalculator
+from services.risk_calculator import ClinicalRiskCalculator, RiskInputs
 # DISEASE-SYMPTOM CSV SERVICE (773 diseases, 377 symptoms)
 from services.disease_symptom_csv_service import DiseaseSymptomCSVService
 # DETERMINISTIC CLINICAL LOGIC (NO LLM)
@@ -487,13 +487,13 @@ OUTPUT (JSON only, no markdown):
             logger.info(f"   - Risk factors: {len(normalized_data.get('risk_factors', []))}")
             
             # COMPATIBILITY: Extract symptom names for services that expect strings
+            # Done once here so downstream consumers can rely on List[str]
             def extract_symptom_names(symptoms_list):
-                """Convert symptoms to string list if they're dicts"""
-                if not symptoms_list:
-                    return []
-                if isinstance(symptoms_list[0], dict):
-                    return [s.get("symptom", str(s)) for s in symptoms_list]
-                return symptoms_list
+                """Convert symptoms to a string list (dict entries use their 'symptom' name)"""
+                return [
+                    s if isinstance(s, str) else s.get("symptom", str(s))
+                    for s in symptoms_list or []
+                ]
             
             # Keep both formats
             symptoms_as_dicts = normalized_data.get("symptoms", [])  # For mappers
@@ -792,7 +792,12 @@ OUTPUT (JSON only, no markdown):
                         logger.warning(f"Query expansion failed for {dx.get('diagnosis')}: {e}")
                         dx_query = dx["diagnosis"]
                     
-                    sp_results = self.statpearls_retriever.retrieve_evidence([dx_query])
+                    # Critical diagnoses get a wider HNSW search (recall where a miss is dangerous)
+                    criticality = self.risk_calculator.classify_safety_from_rules(dx["diagnosis"])["category"]
+                    sp_results = self.statpearls_retriever.retrieve_evidence(
+                        [dx_query],
+                        criticality=criticality
+                    )
                     
                     # PHASE A: Rerank StatPearls
                     try:
@@ -914,6 +919,9 @@ OUTPUT (JSON only, no markdown):
             used_open_patients = set()
             used_statpearls = set()
             
+            # Patient-side risk inputs, shared by every candidate's risk scoring
+            risk_inputs = RiskInputs(normalized_data)
+            
             final_diagnoses = []
             for idx, dx in enumerate(valid_diagnoses[:5], 1):  # Top 5
                 # Build evidence citations from ALL THREE SOURCES with labels
@@ -1098,7 +1106,8 @@ OUTPUT (JSON only, no markdown):
                     risk_assessment = self.risk_calculator.calculate_risk(
                         diagnosis=dx_name,
                         normalized_data=normalized_data,
-                        confidence=llm_confidence  # Use LLM confidence
+                        confidence=llm_confidence,  # Use LLM confidence
+                        risk_inputs=risk_inputs
                     )
                     
                     risk_cat = risk_assessment.risk_level
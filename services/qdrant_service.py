@@ -84,16 +84,20 @@ class QdrantService:
         
         points = []
         
-        for chunk in chunks:
+        try:
+            # Generate all embeddings in one batched encode
+            embeddings = self.embeddings.embed_documents([chunk["text"] for chunk in chunks])
+        except Exception as e:
+            logger.error(f"Error embedding chunks: {e}")
+            return
+        
+        for chunk, embedding in zip(chunks, embeddings):
             try:
-                # Generate embedding
-                embedding = self.embeddings.embed_documents([chunk["text"]])[0]
-                
                 # Create point
                 points.append(
                     PointStruct(
                         id=chunk["id"],
-                        vector=embedding,
+                        vector=embedding.tolist(),
                         payload={
                             "text": chunk["text"],
                             "case_id": chunk.get("case_id", ""),
@@ -349,7 +349,8 @@ class ResponseFormatter:
         raw_symptoms = extracted_data.get("atomic_symptoms", [])
         
         # Import severity calculator
-        from services.severity_calculator import severity_calculator
+        from services.severity_calculator import get_severity_calculator
+        severity_calculator = get_severity_calculator()
         
         # Get clinical text for context-aware severity calculation
         clinical_text = extracted_data.get("expanded_text", "")
@@ -380,17 +381,14 @@ class ResponseFormatter:
                 if "status" not in enhanced:
                     enhanced["status"] = "present"
                 
-                # 🔥 NEW: Calculate severity using comprehensive severity calculator
-                severity_score = severity_calculator.calculate_severity(
-                    symptom=enhanced,
-                    clinical_text=clinical_text
-                )
-                enhanced["severity"] = severity_score
-                
-                logger.debug(f"Symptom '{enhanced.get('base_symptom')}': severity = {severity_score}/10")
-                
                 symptoms.append(enhanced)
         
+        # 🔥 NEW: Calculate severity using comprehensive severity calculator (one batch per note)
+        severity_scores = severity_calculator.calculate_severities(symptoms, clinical_text)
+        for enhanced, severity_score in zip(symptoms, severity_scores):
+            enhanced["severity"] = severity_score
+            logger.debug(f"Symptom '{enhanced.get('base_symptom')}': severity = {severity_score}/10")
+        
         logger.info(f"✅ Enhanced {len(symptoms)} symptoms with severity scores")
         return symptoms
     
@@ -16,13 +16,22 @@ CRITICAL RULES:
 
 from langchain_community.docstore.document import Document
 from typing import List, Dict
+from functools import cached_property
+import heapq
 import logging
+import numpy as np
 from utils.embeddings import SentenceTransformerEmbeddings
 from utils.db import SupabaseVectorStore, format_retrieval_results
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Separator placed after each evidence block in the LLM context
+_SEP = "-" * 80
+
+# HNSW ef_search per safety category: wider search only where a miss is dangerous
+EF_SEARCH_BY_CRITICALITY = {"LOW": 40, "MODERATE": 100, "CRITICAL": 200}
+
 
 class RAGRetriever:
     """
@@ -40,20 +49,34 @@ class RAGRetriever:
         """
         Initialize RAG retriever.
         
+        The embedding model and Supabase client are created on first use,
+        so constructing a retriever stays cheap on paths that never retrieve.
+        
         Args:
             embeddings: Sentence transformers embedding service
             vector_store: Supabase vector store
         """
-        self.embeddings = embeddings or SentenceTransformerEmbeddings()
-        self.vector_store = vector_store or SupabaseVectorStore()
+        self._embeddings_override = embeddings
+        self._vector_store_override = vector_store
         
         logger.info("RAGRetriever initialized")
     
+    @cached_property
+    def embeddings(self) -> SentenceTransformerEmbeddings:
+        """Embedding service, loaded on first access."""
+        return self._embeddings_override or SentenceTransformerEmbeddings()
+    
+    @cached_property
+    def vector_store(self) -> SupabaseVectorStore:
+        """Supabase vector store, connected on first access."""
+        return self._vector_store_override or SupabaseVectorStore()
+    
     def retrieve_evidence(
         self,
         patient_chunks: List,
         top_k: int = None,
-        threshold: float = None
+        threshold: float = None,
+        criticality: str = None
     ) -> List[Dict]:
         """
         Retrieve StatPearls evidence for patient chunks (hardened, clinical-safe).
@@ -69,12 +92,19 @@ class RAGRetriever:
             patient_chunks: List of patient text chunks (dicts or strings)
             top_k: Number of results per query (default from settings)
             threshold: Similarity threshold (default from settings)
+            criticality: Safety category (LOW/MODERATE/CRITICAL) used to pick
+                the HNSW ef_search when HNSW_EF_SEARCH_TUNING is enabled
 
         Returns:
             List of retrieved StatPearls chunks with metadata
         """
         top_k = top_k or settings.TOP_K_RETRIEVAL
         threshold = threshold or settings.SIMILARITY_THRESHOLD
+        ef_search = (
+            EF_SEARCH_BY_CRITICALITY.get(criticality)
+            if settings.HNSW_EF_SEARCH_TUNING
+            else None
+        )
 
         if not patient_chunks:
             logger.warning("No patient chunks provided for retrieval")
@@ -92,49 +122,71 @@ class RAGRetriever:
             else:
                 logger.warning(f"Invalid patient chunk format at index {i}: {chunk}")
         patient_texts = [chunk["text"] for chunk in processed_chunks]
+        if not patient_texts:
+            logger.warning("No valid patient chunks to embed for retrieval")
+            return []
 
         # Embed patient chunks as queries using sentence-transformers
+        # (one batched encode call for all chunks)
         logger.info("Embedding patient chunks as queries...")
-        query_embeddings = []
-        for text in patient_texts:
-            emb = self.embeddings.embed_query(text)
-            if isinstance(emb, list) and emb and isinstance(emb[0], list):
-                emb = emb[0]
-            query_embeddings.append(emb)
-
-        all_results = []
-        seen_chunk_ids = set()
+        query_embeddings = self.embeddings.embed_documents_list(patient_texts)
 
+        # Skip queries that cannot add results: a repeated text returns the
+        # same (already deduplicated) chunks, and a zero vector (model
+        # unavailable) has undefined cosine similarity so matches nothing
+        searched_texts = set()
+        search_indices = []
         for idx, query_emb in enumerate(query_embeddings):
-            logger.debug(f"Retrieving for patient chunk {idx + 1}/{len(query_embeddings)}")
+            text = patient_texts[idx]
+            if text in searched_texts or not any(query_emb):
+                logger.debug(f"Skipping patient chunk {idx + 1}/{len(query_embeddings)} (cannot contribute)")
+                continue
+            searched_texts.add(text)
+            search_indices.append(idx)
 
-            # Similarity search in pgvector (enforce source filter in SQL)
-            results = self.vector_store.similarity_search(
-                query_embedding=query_emb,
-                top_k=top_k,
-                threshold=threshold
-            )
+        # Similarity search in pgvector (enforce source filter in SQL),
+        # all queries in flight concurrently
+        logger.debug(f"Retrieving for {len(search_indices)}/{len(query_embeddings)} patient chunks")
+        results_per_query = self.vector_store.similarity_search_many(
+            [query_embeddings[idx] for idx in search_indices],
+            top_k=top_k,
+            threshold=threshold,
+            ef_search=ef_search
+        )
+
+        all_results = []
+        seen_chunk_ids = set()
 
+        for idx, results in zip(search_indices, results_per_query):
             for result in results:
                 chunk_id = result.get("chunk_id")
 
-                if not chunk_id or chunk_id in seen_chunk_ids:
-                    continue
-                if not result.get("text"):
+                if not chunk_id or not result.get("text"):
                     continue
 
+                if chunk_id in seen_chunk_ids:
+                    continue
                 seen_chunk_ids.add(chunk_id)
+
                 result["related_patient_chunk_id"] = processed_chunks[idx]["chunk_id"]
                 all_results.append(result)
 
-        # Sort all results by similarity score (descending, correct key)
-        all_results.sort(
-            key=lambda x: x.get("similarity_score", 0),
-            reverse=True
-        )
-
-        # Take top overall results
-        all_results = all_results[: top_k * 2]
+        if all_results and all(r.get("embedding") is not None for r in all_results):
+            # Exact cosine re-rank of the union against every query in one matmul
+            all_results = self._rerank_by_exact_cosine(
+                all_results,
+                query_embeddings,
+                processed_chunks,
+                top_k * 2
+            )
+        else:
+            # Keep only the top overall results by similarity score (descending,
+            # correct key); a bounded heap avoids sorting the full N*K result list
+            all_results = heapq.nlargest(
+                top_k * 2,
+                all_results,
+                key=lambda x: x.get("similarity_score", 0)
+            )
 
         logger.info(f"Retrieved {len(all_results)} unique StatPearls chunks")
 
@@ -143,6 +195,56 @@ class RAGRetriever:
 
         return formatted_results
     
+    def _rerank_by_exact_cosine(
+        self,
+        candidates: List[Dict],
+        query_embeddings: List[List[float]],
+        processed_chunks: List[Dict],
+        limit: int
+    ) -> List[Dict]:
+        """
+        Re-score retrieved candidates against all patient queries at once.
+        
+        Each candidate's score becomes its best exact cosine similarity over
+        all queries, and it is attributed to the query it matched best.
+        
+        Args:
+            candidates: Deduplicated results carrying an "embedding" vector
+            query_embeddings: Query vectors, aligned with processed_chunks
+            processed_chunks: Patient chunks the queries were built from
+            limit: Number of results to keep
+        
+        Returns:
+            Top candidates sorted by re-ranked similarity (descending)
+        """
+        Q = np.asarray(query_embeddings, dtype=np.float32)
+        C = np.asarray([c["embedding"] for c in candidates], dtype=np.float32)
+        
+        # L2-normalize (zero vectors stay zero instead of dividing by zero)
+        q_norms = np.linalg.norm(Q, axis=1, keepdims=True)
+        c_norms = np.linalg.norm(C, axis=1, keepdims=True)
+        Q = Q / np.where(q_norms == 0, 1.0, q_norms)
+        C = C / np.where(c_norms == 0, 1.0, c_norms)
+        
+        sim = Q @ C.T  # [num_queries, num_candidates]
+        best = sim.max(axis=0)
+        best_query = sim.argmax(axis=0)
+        
+        if len(candidates) > limit:
+            top = np.argpartition(-best, limit - 1)[:limit]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-best[top], kind="stable")]
+        
+        reranked = []
+        for i in top:
+            candidate = candidates[i]
+            candidate["similarity_score"] = float(best[i])
+            candidate["related_patient_chunk_id"] = processed_chunks[best_query[i]]["chunk_id"]
+            reranked.append(candidate)
+        
+        return reranked
+    
     def retrieve_for_single_query(
         self,
         query_text: str,
@@ -203,26 +305,31 @@ class RAGRetriever:
         # Limit chunks
         evidence_to_use = retrieved_evidence[:max_chunks]
         
-        context_parts = [
-            "===== STATPEARLS EVIDENCE =====\n",
+        # One slot for the header, one per chunk, one for the footer
+        context_parts = [None] * (len(evidence_to_use) + 2)
+        context_parts[0] = (
+            "===== STATPEARLS EVIDENCE =====\n\n"
             f"Retrieved {len(evidence_to_use)} relevant excerpts from StatPearls.\n"
-        ]
+        )
         
         for idx, evidence in enumerate(evidence_to_use, 1):
-            chunk_id = evidence.get("chunk_id", "unknown")
-            source = evidence.get("source", "statpearls")
-            text = evidence.get("text", "")
-            citation = evidence.get("citation", "Citation not available")
-            similarity = evidence.get("similarity_score", 0.0)
+            get = evidence.get
+            chunk_id = get("chunk_id", "unknown")
+            source = get("source", "statpearls")
+            text = get("text", "")
+            citation = get("citation", "Citation not available")
+            similarity = get("similarity_score", 0.0)
             
-            context_parts.append(f"\n[EVIDENCE {idx}]")
-            context_parts.append(f"Source: {source} (Chunk ID: {chunk_id})")
-            context_parts.append(f"Relevance Score: {similarity:.3f}")
-            context_parts.append(f"Citation: {citation}")
-            context_parts.append(f"\nText:\n{text}\n")
-            context_parts.append("-" * 80)
+            context_parts[idx] = (
+                f"\n[EVIDENCE {idx}]\n"
+                f"Source: {source} (Chunk ID: {chunk_id})\n"
+                f"Relevance Score: {similarity:.3f}\n"
+                f"Citation: {citation}\n"
+                f"\nText:\n{text}\n\n"
+                f"{_SEP}"
+            )
         
-        context_parts.append("\n===== END EVIDENCE =====\n")
+        context_parts[-1] = "\n===== END EVIDENCE =====\n"
         
         return "\n".join(context_parts)
     
@@ -242,21 +349,23 @@ class RAGRetriever:
             List of citation dictionaries for response schema
         """
         citations = []
+        append = citations.append
         
         for evidence in retrieved_evidence:
-            text_val = evidence.get("text")
+            get = evidence.get
+            text_val = get("text")
             if text_val is None:
                 text_snippet = ""
             else:
-                text_snippet = text_val[:200] + "..."
-            citation = {
-                "chunk_id": evidence.get("chunk_id"),
-                "source": evidence.get("source", "statpearls"),
+                # Only mark the snippet as truncated when it actually is
+                text_snippet = f"{text_val[:200]}..." if len(text_val) > 200 else text_val
+            append({
+                "chunk_id": get("chunk_id"),
+                "source": get("source", "statpearls"),
                 "text_snippet": text_snippet,
-                "similarity_score": evidence.get("similarity_score", 0.0),
-                "citation": evidence.get("citation")
-            }
-            citations.append(citation)
+                "similarity_score": get("similarity_score", 0.0),
+                "citation": get("citation")
+            })
         
         return citations
 
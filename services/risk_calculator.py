@@ -5,14 +5,60 @@ Implements validated clinical decision rules (HEART, Wells, PERC, etc.)
 
 import logging
 import json
+import re
+import sys
 from typing import Dict, Optional, List
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from functools import cached_property
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# Risk levels, interned so comparisons downstream are pointer checks
+RISK_RED = sys.intern("Red/Danger")
+RISK_ORANGE = sys.intern("Orange/Warning")
+RISK_BLUE = sys.intern("Blue/Low")
 
-@dataclass
+# Critical safety rules (life-threatening)
+_CRITICAL_CONDITIONS = frozenset([
+    "ACS", "STROKE", "SEPSIS", "ANAPHYLAXIS", "ACUTE_MI",
+    "PULMONARY EMBOLISM", "AORTIC DISSECTION"
+])
+
+# Matched against the upper-cased diagnosis name. Acronyms need word
+# boundaries (so "PACS" is not "ACS"); full terms still match inside
+# compounds such as "UROSEPSIS" or "HEATSTROKE".
+_CRITICAL_DX_RE = re.compile(
+    r"\b(?:ACS|ACUTE[_ ]MI)\b|STROKE|SEPSIS|ANAPHYLAXIS|PULMONARY EMBOLISM|AORTIC DISSECTION"
+)
+
+
+class RiskInputs:
+    """
+    One request's patient data, as seen by the risk scorers.
+    
+    The lower-cased symptom and past-history strings are joined on first use
+    and shared by every scorer and candidate diagnosis in the request. The
+    wrapped dict is never modified (it is returned to clients as extracted_data).
+    """
+    
+    def __init__(self, data: Dict):
+        self.data = data
+        # HEART result for this patient (independent of the candidate diagnosis)
+        self.heart_assessment: Optional["RiskAssessment"] = None
+    
+    @cached_property
+    def symptoms_text(self) -> str:
+        """Lower-cased joined symptoms."""
+        return " ".join(self.data.get("symptoms") or []).lower()
+    
+    @cached_property
+    def pmhx_text(self) -> str:
+        """Lower-cased joined past medical history."""
+        return " ".join(self.data.get("past_medical_history") or []).lower()
+
+
+@dataclass(slots=True, frozen=True)
 class RiskAssessment:
     """Container for risk assessment results."""
     score: float
@@ -56,19 +102,15 @@ class ClinicalRiskCalculator:
         if triggered_rules is None:
             triggered_rules = []
         
-        # Critical safety rules (life-threatening)
-        critical_conditions = ["ACS", "STROKE", "SEPSIS", "ANAPHYLAXIS", "ACUTE_MI", 
-                              "PULMONARY EMBOLISM", "AORTIC DISSECTION"]
-        
         # Check diagnosis name directly
-        diagnosis_upper = diagnosis_name.upper()
-        is_critical = any(crit in diagnosis_upper for crit in critical_conditions)
+        is_critical = _CRITICAL_DX_RE.search(diagnosis_name.upper()) is not None
+        critical_rules = [r for r in triggered_rules if r in _CRITICAL_CONDITIONS]
         
-        if is_critical or any(rule in triggered_rules for rule in critical_conditions):
+        if is_critical or critical_rules:
             return {
                 'category': 'CRITICAL',
                 'description': 'Life-threatening condition if delayed',
-                'triggered_rules': [r for r in triggered_rules if r in critical_conditions] or [diagnosis_name],
+                'triggered_rules': critical_rules or [diagnosis_name],
                 'basis': 'Rule-based safety criteria'
             }
         
@@ -92,7 +134,8 @@ class ClinicalRiskCalculator:
         self,
         diagnosis: str,
         normalized_data: Dict,
-        confidence: float
+        confidence: float,
+        risk_inputs: Optional[RiskInputs] = None
     ) -> RiskAssessment:
         """
         Calculate risk using appropriate scoring system for diagnosis.
@@ -101,21 +144,30 @@ class ClinicalRiskCalculator:
             diagnosis: Diagnosis name
             normalized_data: Patient data dict
             confidence: Base confidence score
+            risk_inputs: RiskInputs for normalized_data, shared across the
+                request's candidate diagnoses (built here if omitted)
             
         Returns:
             RiskAssessment object
         """
+        if risk_inputs is None:
+            risk_inputs = RiskInputs(normalized_data)
         dx_upper = diagnosis.upper()
         
         # Route to appropriate calculator
         if any(term in dx_upper for term in ["ACUTE CORONARY", "MYOCARDIAL INFARCTION", "ACS", "CHEST PAIN"]):
-            return self._calculate_heart_score(normalized_data, confidence)
+            # HEART depends only on patient data, so it is scored once per
+            # request; each cardiac candidate gets its own components dict
+            if risk_inputs.heart_assessment is None:
+                risk_inputs.heart_assessment = self._calculate_heart_score(risk_inputs, confidence)
+            heart = risk_inputs.heart_assessment
+            return replace(heart, components=dict(heart.components))
         
         elif any(term in dx_upper for term in ["PULMONARY EMBOLISM", "PE"]):
-            return self._calculate_wells_pe_score(normalized_data, confidence)
+            return self._calculate_wells_pe_score(risk_inputs, confidence)
         
         elif any(term in dx_upper for term in ["DVT", "DEEP VEIN THROMBOSIS"]):
-            return self._calculate_wells_dvt_score(normalized_data, confidence)
+            return self._calculate_wells_dvt_score(risk_inputs, confidence)
         
         else:
             # Default: Use confidence-based heuristic
@@ -123,7 +175,7 @@ class ClinicalRiskCalculator:
     
     def _calculate_heart_score(
         self,
-        data: Dict,
+        inputs: RiskInputs,
         confidence: float
     ) -> RiskAssessment:
         """
@@ -134,9 +186,9 @@ class ClinicalRiskCalculator:
         components = {}
         
         # History (0-2)
-        symptoms = [s.lower() for s in data.get("symptoms", [])]
-        if any(term in " ".join(symptoms) for term in ["chest pain", "pressure", "tightness"]):
-            if any(term in " ".join(symptoms) for term in ["radiation", "diaphoresis", "nausea"]):
+        symptoms_text = inputs.symptoms_text
+        if any(term in symptoms_text for term in ["chest pain", "pressure", "tightness"]):
+            if any(term in symptoms_text for term in ["radiation", "diaphoresis", "nausea"]):
                 components["History"] = 2  # Highly suspicious
                 score += 2
             else:
@@ -146,7 +198,7 @@ class ClinicalRiskCalculator:
             components["History"] = 0  # Slightly suspicious
         
         # Age (0-2)
-        age = data.get("age")
+        age = inputs.data.get("age")
         if age:
             if age >= 65:
                 components["Age"] = 2
@@ -159,7 +211,7 @@ class ClinicalRiskCalculator:
         
         # Risk factors (0-2) - check for HTN, DM, smoking, family history
         risk_factors = 0
-        pmhx = " ".join(data.get("past_medical_history", [])).lower() if data.get("past_medical_history") else ""
+        pmhx = inputs.pmhx_text
         
         if "hypertension" in pmhx or "htn" in pmhx:
             risk_factors += 1
@@ -183,7 +235,7 @@ class ClinicalRiskCalculator:
         score += 1
         
         # Troponin (0-2) - check labs
-        labs = data.get("labs", {})
+        labs = inputs.data.get("labs", {})
         if labs:
             troponin = labs.get("troponin") or labs.get("Troponin")
             if troponin and troponin > 0.1:
@@ -198,13 +250,13 @@ class ClinicalRiskCalculator:
         
         # Interpret score
         if score >= 7:
-            risk_level = "Red/Danger"
+            risk_level = RISK_RED
             interpretation = "High risk for MACE (Major Adverse Cardiac Event)"
         elif score >= 4:
-            risk_level = "Orange/Warning"
+            risk_level = RISK_ORANGE
             interpretation = "Moderate risk - further testing recommended"
         else:
-            risk_level = "Blue/Low"
+            risk_level = RISK_BLUE
             interpretation = "Low risk for MACE"
         
         return RiskAssessment(
@@ -217,7 +269,7 @@ class ClinicalRiskCalculator:
     
     def _calculate_wells_pe_score(
         self,
-        data: Dict,
+        inputs: RiskInputs,
         confidence: float
     ) -> RiskAssessment:
         """
@@ -226,9 +278,9 @@ class ClinicalRiskCalculator:
         score = 0
         components = {}
         
-        symptoms = [s.lower() for s in data.get("symptoms", [])]
-        physical_exam = " ".join(data.get("physical_exam", [])).lower()
-        pmhx = " ".join(data.get("past_medical_history", [])).lower() if data.get("past_medical_history") else ""
+        symptoms_text = inputs.symptoms_text
+        physical_exam = " ".join(inputs.data.get("physical_exam", [])).lower()
+        pmhx = inputs.pmhx_text
         
         # Clinical signs of DVT (+3)
         if any(term in physical_exam for term in ["leg swelling", "calf tenderness", "edema"]):
@@ -241,7 +293,7 @@ class ClinicalRiskCalculator:
             score += 3
         
         # Heart rate > 100 (+1.5)
-        vitals = data.get("vitals", {})
+        vitals = inputs.data.get("vitals", {})
         hr = vitals.get("HR") or vitals.get("heart_rate")
         if hr and hr > 100:
             components["Tachycardia"] = 1.5
@@ -258,7 +310,7 @@ class ClinicalRiskCalculator:
             score += 1.5
         
         # Hemoptysis (+1)
-        if any(term in " ".join(symptoms) for term in ["hemoptysis", "coughing blood"]):
+        if any(term in symptoms_text for term in ["hemoptysis", "coughing blood"]):
             components["Hemoptysis"] = 1
             score += 1
         
@@ -269,13 +321,13 @@ class ClinicalRiskCalculator:
         
         # Interpret
         if score > 6:
-            risk_level = "Red/Danger"
+            risk_level = RISK_RED
             interpretation = "High probability of PE"
         elif score >= 2:
-            risk_level = "Orange/Warning"
+            risk_level = RISK_ORANGE
             interpretation = "Moderate probability - imaging recommended"
         else:
-            risk_level = "Blue/Low"
+            risk_level = RISK_BLUE
             interpretation = "Low probability of PE"
         
         return RiskAssessment(
@@ -286,33 +338,33 @@ class ClinicalRiskCalculator:
             interpretation=interpretation
         )
     
-    def _calculate_wells_dvt_score(self, data: Dict, confidence: float) -> RiskAssessment:
+    def _calculate_wells_dvt_score(self, inputs: RiskInputs, confidence: float) -> RiskAssessment:
         """Wells Score for DVT."""
         # Similar structure to Wells PE - omitted for brevity
         # Would implement full scoring logic here
-        return self._default_risk_assessment("DVT", confidence, data)
+        return self._default_risk_assessment("DVT", confidence, inputs)
     
     def _default_risk_assessment(
         self,
         diagnosis: str,
         confidence: float,
-        normalized_data: Dict = None
+        inputs: Optional[RiskInputs] = None
     ) -> RiskAssessment:
         """
         Fallback risk: driven by DANGER, not confidence.
         Confidence does NOT lower risk!
         """
-        if normalized_data is None:
-            normalized_data = {}
+        if inputs is None:
+            inputs = RiskInputs({})
         
         # Step 1: Danger if missed (from learned priors)
         danger_if_missed = self._get_danger_score(diagnosis)
         
         # Step 2: Symptom severity/acuity
-        symptom_severity = self._assess_symptom_severity(normalized_data)
+        symptom_severity = self._assess_symptom_severity(inputs)
         
         # Step 3: Missing data penalty (conservative!)
-        missing_data_penalty = self._calculate_missing_data_penalty(normalized_data)
+        missing_data_penalty = self._calculate_missing_data_penalty(inputs)
         
         # Calculate risk (confidence DOES NOT lower risk!)
         risk_score = (
@@ -323,13 +375,13 @@ class ClinicalRiskCalculator:
         
         # Risk level
         if risk_score >= 7:
-            risk_level = "Red/Danger"
+            risk_level = RISK_RED
             interpretation = "High-risk condition - immediate evaluation warranted"
         elif risk_score >= 4:
-            risk_level = "Orange/Warning"
+            risk_level = RISK_ORANGE
             interpretation = "Moderate risk - expedited workup recommended"
         else:
-            risk_level = "Blue/Low"
+            risk_level = RISK_BLUE
             interpretation = "Lower acuity - standard evaluation appropriate"
         
         return RiskAssessment(
@@ -365,7 +417,7 @@ class ClinicalRiskCalculator:
         # Default
         return self.danger_priors.get("_default", 4.0)
     
-    def _assess_symptom_severity(self, data: Dict) -> float:
+    def _assess_symptom_severity(self, inputs: RiskInputs) -> float:
         """
         How sick is the patient RIGHT NOW?
         Returns 0-10.
@@ -373,7 +425,7 @@ class ClinicalRiskCalculator:
         severity = 0
         
         # Check vitals
-        vitals = data.get("vitals", {})
+        vitals = inputs.data.get("vitals", {})
         if vitals.get("SpO2") and vitals["SpO2"] < 90:
             severity += 3
         if vitals.get("HR") and vitals["HR"] > 120:
@@ -382,15 +434,13 @@ class ClinicalRiskCalculator:
             severity += 3
         
         # Check altered mental status
-        symptoms = data.get("symptoms", [])
-        if symptoms:
-            symptoms_text = " ".join(symptoms).lower()
-            if any(term in symptoms_text for term in ["confusion", "altered", "unresponsive", "lethargic"]):
-                severity += 4
+        symptoms_text = inputs.symptoms_text
+        if any(term in symptoms_text for term in ["confusion", "altered", "unresponsive", "lethargic"]):
+            severity += 4
         
         return min(severity, 10)
     
-    def _calculate_missing_data_penalty(self, data: Dict) -> float:
+    def _calculate_missing_data_penalty(self, inputs: RiskInputs) -> float:
         """
         Conservative: missing data = assume worse.
         Returns 0-10.
@@ -399,17 +449,14 @@ class ClinicalRiskCalculator:
         
         # Missing vitals
         required_vitals = ["HR", "BP", "RR", "Temp", "SpO2"]
-        vitals = data.get("vitals", {})
+        vitals = inputs.data.get("vitals", {})
         missing_vitals = sum(1 for v in required_vitals if v not in vitals)
         penalty += missing_vitals * 0.5
         
         # Missing labs (if symptoms suggest need)
-        symptoms = data.get("symptoms", [])
-        if symptoms:
-            symptoms_text = " ".join(symptoms).lower()
-            if "chest pain" in symptoms_text:
-                if "troponin" not in data.get("labs", {}):
-                    penalty += 2  # Missing critical lab
+        if "chest pain" in inputs.symptoms_text:
+            if "troponin" not in inputs.data.get("labs", {}):
+                penalty += 2  # Missing critical lab
         
         return min(penalty, 5)
 
@@ -5,14 +5,48 @@ Replaces LLM-based confidence with deterministic clinical logic
 
 import json
 import logging
+import os
+import pickle
+import sys
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Tuple
 from dataclasses import dataclass
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Preprocessed KB state cached next to the JSON; bump the version whenever
+# the preprocessing changes so stale caches are rebuilt
+_KB_CACHE_VERSION = 1
+_KB_CACHE_ATTRS = (
+    'kb', 'symptom_weights', 'negative_features', 'thresholds',
+    '_threshold_values', '_category_names', 'critical_vars',
+    '_critical_vars_normalized', '_disease_index', '_feature_index',
+    '_W_pos', '_W_neg', '_W'
+)
 
-@dataclass
+# Human-readable likelihood category labels
+_CATEGORY_LABELS = {
+    "very_likely": "Very Likely",
+    "likely": "Likely",
+    "possible": "Possible",
+    "unlikely": "Unlikely",
+    "very_unlikely": "Very Unlikely"
+}
+
+
+# Spaces and hyphens both become underscores in normalized feature names
+_NORM_TABLE = str.maketrans({' ': '_', '-': '_'})
+
+
+@lru_cache(maxsize=4096)
+def _normalize_feature(feature: str) -> str:
+    """Normalize feature names for matching (memoized across requests)."""
+    return feature.lower().translate(_NORM_TABLE)
+
+
+@dataclass(slots=True, frozen=True)
 class LikelihoodAssessment:
     """Clinical likelihood assessment (not fake percentage)"""
     category: str  # very_likely, likely, possible, unlikely, very_unlikely
@@ -34,15 +68,171 @@ class RuleBasedScoringEngine:
         logger.info("Initializing Rule-Based Scoring Engine...")
         
         kb_path = Path(__file__).parent.parent / "config" / "clinical_knowledge_base.json"
-        with open(kb_path, 'r') as f:
-            self.kb = json.load(f)
+        cache_path = kb_path.with_suffix('.pkl')
+        
+        if not self._load_kb_cache(kb_path, cache_path):
+            with open(kb_path, 'r') as f:
+                self.kb = json.load(f)
+            self._preprocess_kb()
+            self._save_kb_cache(cache_path)
         
-        self.symptom_weights = self.kb['symptom_disease_weights']
-        self.negative_features = self.kb['negative_features']
+        # Unpickling does not preserve interning, so intern after either path
+        self._intern_kb_strings()
+        
+        logger.info(f"✅ Loaded knowledge base: {len(self.symptom_weights)} diseases")
+    
+    def _preprocess_kb(self):
+        """Normalize KB feature names and build the scoring matrices."""
+        # KB-side feature names are normalized once here, so scoring only
+        # normalizes the patient side
+        self.symptom_weights = {
+            dx: {_normalize_feature(f): w for f, w in weights.items()}
+            for dx, weights in self.kb['symptom_disease_weights'].items()
+        }
+        self.negative_features = {
+            dx: {**neg, 'features': [_normalize_feature(f) for f in neg['features']]}
+            for dx, neg in self.kb['negative_features'].items()
+        }
+        # Hash sets for O(1) contradicting-feature membership
+        for neg in self.negative_features.values():
+            neg['features_set'] = frozenset(neg['features'])
         self.thresholds = self.kb['likelihood_thresholds']
+        # Ascending category cut-offs; searchsorted maps scores to _category_names
+        self._threshold_values = np.array(
+            [self.thresholds[k] for k in ('unlikely', 'possible', 'likely', 'very_likely')],
+            dtype=np.float64
+        )
+        self._category_names = ['very_unlikely', 'unlikely', 'possible', 'likely', 'very_likely']
         self.critical_vars = self.kb['critical_variables']
         
-        logger.info(f"✅ Loaded knowledge base: {len(self.symptom_weights)} diseases")
+        # (original, normalized) critical variable names, normalized once
+        self._critical_vars_normalized = [
+            (var, _normalize_feature(var))
+            for variables in self.critical_vars.values()
+            for var in variables
+        ]
+        
+        self._build_weight_matrices()
+    
+    def _intern_kb_strings(self):
+        """
+        Intern disease, feature and category names used as lookup keys.
+        
+        Patient features normalized at request time are matched against these
+        keys; interned keys share one object per name across the tables.
+        """
+        intern = sys.intern
+        
+        self.symptom_weights = {
+            intern(dx): {intern(f): w for f, w in weights.items()}
+            for dx, weights in self.symptom_weights.items()
+        }
+        for neg in self.negative_features.values():
+            neg['features'] = [intern(f) for f in neg['features']]
+            neg['features_set'] = frozenset(neg['features'])
+        self.negative_features = {intern(dx): neg for dx, neg in self.negative_features.items()}
+        self.critical_vars = {
+            intern(category): [intern(var) for var in variables]
+            for category, variables in self.critical_vars.items()
+        }
+        self._critical_vars_normalized = [
+            (intern(var), intern(var_normalized))
+            for var, var_normalized in self._critical_vars_normalized
+        ]
+        self._disease_index = {intern(dx): i for dx, i in self._disease_index.items()}
+        self._feature_index = {intern(f): j for f, j in self._feature_index.items()}
+        self._category_names = [intern(name) for name in self._category_names]
+    
+    def _load_kb_cache(self, kb_path: Path, cache_path: Path) -> bool:
+        """
+        Restore preprocessed KB state from the pickle cache.
+        
+        Returns:
+            True if a cache at least as new as the JSON was loaded
+        """
+        try:
+            if cache_path.stat().st_mtime < kb_path.stat().st_mtime:
+                return False
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable KB cache {cache_path}: {e}")
+            return False
+        
+        if not isinstance(cached, dict) or cached.get('version') != _KB_CACHE_VERSION:
+            return False
+        
+        for attr in _KB_CACHE_ATTRS:
+            setattr(self, attr, cached[attr])
+        return True
+    
+    def _save_kb_cache(self, cache_path: Path):
+        """Write preprocessed KB state to the pickle cache (best effort)."""
+        cached = {attr: getattr(self, attr) for attr in _KB_CACHE_ATTRS}
+        cached['version'] = _KB_CACHE_VERSION
+        
+        # Write to a temp file and rename so concurrent workers never read a partial cache
+        tmp_path = cache_path.with_suffix(f'.pkl.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write KB cache {cache_path}: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+    
+    def _build_weight_matrices(self):
+        """
+        Precompute dense disease x feature matrices for vectorized scoring.
+        
+        The KB is small (a handful of diseases, tens of features), so dense
+        NumPy arrays beat sparse storage. Scores for every disease are then
+        (W_pos - W_neg) @ feature_counts.
+        """
+        self._disease_index = {dx: i for i, dx in enumerate(self.symptom_weights)}
+        
+        features = set()
+        for weights in self.symptom_weights.values():
+            features.update(weights)
+        for neg in self.negative_features.values():
+            features.update(neg['features'])
+        self._feature_index = {f: j for j, f in enumerate(sorted(features))}
+        
+        # Integer KB weights give integer scores (as before); any fractional
+        # weight switches the matrices to float64 instead of truncating it
+        integral = all(
+            isinstance(weight, int)
+            for weights in self.symptom_weights.values()
+            for weight in weights.values()
+        )
+        dtype = np.int64 if integral else np.float64
+        
+        shape = (len(self._disease_index), len(self._feature_index))
+        self._W_pos = np.zeros(shape, dtype=dtype)
+        self._W_neg = np.zeros(shape, dtype=dtype)
+        
+        for dx, i in self._disease_index.items():
+            for feature, weight in self.symptom_weights[dx].items():
+                self._W_pos[i, self._feature_index[feature]] = weight
+            if dx in self.negative_features:
+                for feature in self.negative_features[dx]['features_set']:
+                    self._W_neg[i, self._feature_index[feature]] = 1  # -1 per contradicting feature
+        
+        self._W = self._W_pos - self._W_neg
+    
+    def _score_all_diseases(self, normalized_features: List[str]) -> np.ndarray:
+        """Raw scores for every KB disease in one matrix-vector product."""
+        x = np.zeros(len(self._feature_index), dtype=self._W.dtype)
+        for feature in normalized_features:
+            j = self._feature_index.get(feature)
+            if j is not None:
+                x[j] += 1
+        return self._W @ x
     
     def calculate_likelihood(
         self,
@@ -64,40 +254,42 @@ class RuleBasedScoringEngine:
         patient_data = patient_data or {}
         
         # Normalize feature names
-        normalized_features = [self._normalize_feature(f) for f in patient_features]
+        normalized_features = [_normalize_feature(f) for f in patient_features]
         
         # Get disease weights
         if diagnosis not in self.symptom_weights:
             logger.warning(f"No symptom weights for {diagnosis} - using default")
             return self._default_assessment(diagnosis)
         
-        disease_weights = self.symptom_weights[diagnosis]
+        # Calculate score (negative features carry a -1 penalty each)
+        score = self._score_all_diseases(normalized_features)[self._disease_index[diagnosis]].item()
         
-        # Calculate score
-        score = 0
-        supporting = []
+        # Check missing critical data
+        missing = self._identify_missing_data(patient_data)
         
-        for feature in normalized_features:
-            if feature in disease_weights:
-                weight = disease_weights[feature]
-                score += weight
-                if weight > 0:
-                    supporting.append(feature)
+        return self._build_assessment(diagnosis, normalized_features, score, missing)
+    
+    def _build_assessment(
+        self,
+        diagnosis: str,
+        normalized_features: List[str],
+        score: float,
+        missing: List[str],
+        category: str = None
+    ) -> LikelihoodAssessment:
+        """Assemble the assessment (features, category, reasoning) for a scored diagnosis."""
+        disease_weights = self.symptom_weights[diagnosis]
+        supporting = [f for f in normalized_features if disease_weights.get(f, 0) > 0]
         
-        # Check negative features
         negative_present = []
-        if diagnosis in self.negative_features:
-            neg_features = self.negative_features[diagnosis]['features']
-            for feature in normalized_features:
-                if feature in neg_features:
-                    negative_present.append(feature)
-                    score -= 1  # Penalty for contradicting features
-        
-        # Check missing critical data
-        missing = self._identify_missing_data(patient_data)
+        neg_data = self.negative_features.get(diagnosis)
+        if neg_data is not None:
+            neg_features = neg_data['features_set']
+            negative_present = [f for f in normalized_features if f in neg_features]
         
         # Map score to likelihood category
-        category = self._score_to_category(score)
+        if category is None:
+            category = self._score_to_category(score)
         
         # Generate reasoning
         reasoning = self._generate_reasoning(
@@ -105,7 +297,8 @@ class RuleBasedScoringEngine:
             category,
             supporting,
             negative_present,
-            missing
+            missing,
+            neg_data
         )
         
         return LikelihoodAssessment(
@@ -134,10 +327,25 @@ class RuleBasedScoringEngine:
         Returns:
             List of (diagnosis, assessment) tuples, sorted by likelihood
         """
+        patient_data = patient_data or {}
+        normalized_features = [_normalize_feature(f) for f in patient_features]
+        
+        # Score every KB disease at once; missing data is patient-wide
+        scores = self._score_all_diseases(normalized_features)
+        categories = self._score_to_category_batch(scores)
+        missing = self._identify_missing_data(patient_data)
+        
         assessments = []
         
         for dx in diagnoses:
-            assessment = self.calculate_likelihood(dx, patient_features, patient_data)
+            i = self._disease_index.get(dx)
+            if i is None:
+                logger.warning(f"No symptom weights for {dx} - using default")
+                assessment = self._default_assessment(dx)
+            else:
+                assessment = self._build_assessment(
+                    dx, normalized_features, scores[i].item(), missing, categories[i]
+                )
             assessments.append((dx, assessment))
         
         # Sort by raw score (descending)
@@ -145,10 +353,6 @@ class RuleBasedScoringEngine:
         
         return assessments
     
-    def _normalize_feature(self, feature: str) -> str:
-        """Normalize feature names for matching."""
-        return feature.lower().replace(' ', '_').replace('-', '_')
-    
     def _score_to_category(self, score: float) -> str:
         """Convert raw score to likelihood category."""
         if score >= self.thresholds['very_likely']:
@@ -162,18 +366,40 @@ class RuleBasedScoringEngine:
         else:
             return "very_unlikely"
     
+    def _score_to_category_batch(self, scores: np.ndarray) -> List[str]:
+        """Convert an array of raw scores to likelihood categories in one pass."""
+        idx = np.searchsorted(self._threshold_values, scores, side='right')
+        names = self._category_names
+        return [names[i] for i in idx.tolist()]
+    
     def _identify_missing_data(self, patient_data: Dict) -> List[str]:
         """Identify missing critical clinical variables."""
-        missing = []
+        present = self._collect_normalized_terms(patient_data)
         
-        for category, variables in self.critical_vars.items():
-            for var in variables:
-                var_normalized = self._normalize_feature(var)
-                # Check if variable is present in patient data
-                if var_normalized not in str(patient_data).lower():
-                    missing.append(var)
+        return [var for var, var_normalized in self._critical_vars_normalized if var_normalized not in present]
+    
+    def _collect_normalized_terms(self, data) -> set:
+        """
+        Collect normalized dict keys and string values from nested patient data.
         
-        return missing
+        A critical variable counts as present when it is a key (e.g. a lab or
+        vital name) or a listed finding, not when it merely appears inside
+        some longer value.
+        """
+        terms = set()
+        stack = [data]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, dict):
+                for key, value in item.items():
+                    if isinstance(key, str):
+                        terms.add(_normalize_feature(key))
+                    stack.append(value)
+            elif isinstance(item, (list, tuple, set)):
+                stack.extend(item)
+            elif isinstance(item, str):
+                terms.add(_normalize_feature(item))
+        return terms
     
     def _generate_reasoning(
         self,
@@ -181,20 +407,19 @@ class RuleBasedScoringEngine:
         category: str,
         supporting: List[str],
         negative: List[str],
-        missing: List[str]
+        missing: List[str],
+        neg_data: Dict = None
     ) -> str:
-        """Generate human-readable reasoning."""
+        """Generate human-readable reasoning (neg_data: the diagnosis's negative_features entry)."""
         
         # Category description
-        category_map = {
-            "very_likely": "Very Likely",
-            "likely": "Likely",
-            "possible": "Possible",
-            "unlikely": "Unlikely",
-            "very_unlikely": "Very Unlikely"
-        }
+        headline = f"{diagnosis} is {_CATEGORY_LABELS.get(category, 'Unknown')}."
         
-        reasoning_parts = [f"{diagnosis} is {category_map.get(category, 'Unknown')}."]
+        # Common case: nothing else to say
+        if not supporting and not negative and len(missing) <= 5:
+            return headline
+        
+        reasoning_parts = [headline]
         
         # Supporting features
         if supporting:
@@ -204,8 +429,8 @@ class RuleBasedScoringEngine:
         # Negative features
         if negative:
             features_str = ", ".join(negative)
-            if diagnosis in self.negative_features:
-                neg_reasoning = self.negative_features[diagnosis]['reasoning']
+            if neg_data is not None:
+                neg_reasoning = neg_data['reasoning']
                 reasoning_parts.append(f"However, {features_str} present. {neg_reasoning}.")
         
         # Missing data
@@ -240,13 +465,10 @@ class RuleBasedScoringEngine:
             return ""
         
         neg_data = self.negative_features[diagnosis]
-        neg_features = neg_data['features']
-        
-        # Check which negative features are present
-        normalized_features = [self._normalize_feature(f) for f in patient_features]
-        present_negatives = [f for f in neg_features if f in normalized_features]
+        neg_features = neg_data['features_set']
         
-        if not present_negatives:
+        # Check whether any negative feature is present
+        if not any(_normalize_feature(f) in neg_features for f in patient_features):
             return ""
         
         # Generate reasoning
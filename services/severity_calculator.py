@@ -5,7 +5,14 @@ No LLM/Model calls - uses keywords, structured data, and heuristics
 
 import logging
 import re
-from typing import Dict, Optional
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+try:
+    import ahocorasick  # Optional: single-pass severity keyword scan
+except ImportError:
+    ahocorasick = None
 
 logger = logging.getLogger(__name__)
 
@@ -58,6 +65,49 @@ class SymptomSeverityCalculator:
             "diarrhea": self._calculate_gi_severity,
         }
         
+        # Token trie over rule names: longest known phrase inside a symptom
+        # name picks the rule ("severe chest pain" -> "chest pain")
+        self._token_re = re.compile(r'[a-z0-9]+')
+        self._symptom_trie = {}
+        for name, rule in self.symptom_rules.items():
+            node = self._symptom_trie
+            for token in self._token_re.findall(name):
+                node = node.setdefault(token, {})
+            node[None] = rule
+        
+        # Precompiled patterns (avoid per-call pattern cache lookups)
+        self._pain_scale_re = re.compile(r'(\d+)\s*(?:/|out of)\s*10')
+        # Temperature patterns as one zero-width alternation, so a single scan
+        # yields every position where any of them matches (in priority order:
+        # Fahrenheit, Celsius, "temp"/"temperature", bare "T")
+        self._fever_re = re.compile(
+            r'(?=(?P<fahrenheit>\d{2,3}\.?\d*)\s*°?[Ff]'
+            r'|(?P<celsius>\d{2}\.?\d*)\s*°?[Cc]'
+            r'|temp(?:erature)?:?\s*(?P<temp>\d{2,3}\.?\d*)'
+            r'|[Tt]:?\s*(?P<t>\d{2,3}\.?\d*))'
+        )
+        self._fever_groups = ("fahrenheit", "celsius", "temp", "t")
+        
+        # Aho-Corasick automaton over all severity keywords (keyword -> highest level)
+        self._severity_ac = None
+        if ahocorasick is not None:
+            self._severity_ac = ahocorasick.Automaton()
+            for severity_level, keywords in self.severity_keywords.items():
+                for keyword in keywords:
+                    level = max(severity_level, self._severity_ac.get(keyword, -1))
+                    self._severity_ac.add_word(keyword, level)
+            self._severity_ac.make_automaton()
+        
+        # Fallback scan order: every (keyword, level), highest level first
+        self._flat_severity = sorted(
+            ((keyword, level) for level, keywords in self.severity_keywords.items() for keyword in keywords),
+            key=lambda item: -item[1]
+        )
+        
+        # Keyword scans memoized on their combined text: symptoms from the same
+        # note that add no text of their own share one scan
+        self._scan_severity_text = lru_cache(maxsize=128)(self._scan_severity_text_uncached)
+        
         logger.info("Symptom Severity Calculator initialized")
     
     def calculate_severity(self, symptom: Dict, clinical_text: str = "") -> int:
@@ -79,15 +129,19 @@ class SymptomSeverityCalculator:
             if 0 <= existing_severity <= 10:
                 return int(existing_severity)
         
+        # Keyword-based severity, scanned once and shared with the rules
+        kw_severity = self._extract_severity_from_keywords(symptom, clinical_text)
+        
         # Try symptom-specific rules first
-        if base_symptom in self.symptom_rules:
-            severity = self.symptom_rules[base_symptom](symptom, clinical_text)
+        rule = self._match_symptom_rule(base_symptom)
+        if rule is not None:
+            severity = rule(symptom, clinical_text, kw_severity)
             if severity is not None:
                 logger.debug(f"Symptom '{base_symptom}': rule-based severity = {severity}")
                 return severity
         
         # Fallback to keyword-based extraction
-        severity = self._extract_severity_from_keywords(symptom, clinical_text)
+        severity = kw_severity
         if severity is not None:
             logger.debug(f"Symptom '{base_symptom}': keyword-based severity = {severity}")
             return severity
@@ -97,6 +151,37 @@ class SymptomSeverityCalculator:
         logger.debug(f"Symptom '{base_symptom}': default severity = {default}")
         return default
     
+    def calculate_severities(self, symptoms: List[Dict], clinical_text: str = "") -> List[int]:
+        """
+        Calculate severity for every symptom extracted from one clinical note
+        
+        Args:
+            symptoms: Symptom dictionaries
+            clinical_text: Full clinical note shared by all symptoms
+            
+        Returns:
+            Severity scores (0-10), in symptom order
+        """
+        return [self.calculate_severity(symptom, clinical_text) for symptom in symptoms]
+    
+    def _match_symptom_rule(self, base_symptom: str):
+        """Find the rule for the longest known symptom phrase in base_symptom (whole words)."""
+        rule = self.symptom_rules.get(base_symptom)
+        if rule is not None:
+            return rule
+        
+        tokens = self._token_re.findall(base_symptom)
+        best_rule, best_len = None, 0
+        for start in range(len(tokens)):
+            node = self._symptom_trie
+            for end in range(start, len(tokens)):
+                node = node.get(tokens[end])
+                if node is None:
+                    break
+                if None in node and end - start + 1 > best_len:
+                    best_rule, best_len = node[None], end - start + 1
+        return best_rule
+    
     def _extract_severity_from_keywords(self, symptom: Dict, clinical_text: str) -> Optional[int]:
         """Extract severity from keywords in symptom description"""
         
@@ -108,33 +193,45 @@ class SymptomSeverityCalculator:
             clinical_text
         ]
         combined_text = " ".join(str(s) for s in text_sources if s).lower()
+        return self._scan_severity_text(combined_text)
+    
+    def _scan_severity_text_uncached(self, combined_text: str) -> Optional[int]:
+        """Pain scale or highest severity keyword in lowercased text (see _scan_severity_text)"""
         
-        # Look for pain scale ratings (e.g., "8/10", "8 out of 10")
-        pain_scale_match = re.search(r'(\d+)\s*(?:/|out of)\s*10', combined_text)
+        # Look for pain scale ratings (e.g., "8/10", "8 out of 10"); every
+        # rating contains "10", so a literal check skips the regex otherwise
+        pain_scale_match = "10" in combined_text and self._pain_scale_re.search(combined_text)
         if pain_scale_match:
             score = int(pain_scale_match.group(1))
             if 0 <= score <= 10:
                 return score
         
-        # Check severity keywords (highest priority first)
-        for severity_level in sorted(self.severity_keywords.keys(), reverse=True):
-            keywords = self.severity_keywords[severity_level]
-            for keyword in keywords:
-                if keyword in combined_text:
-                    return severity_level
+        # Check severity keywords (highest level matched wins)
+        if self._severity_ac is not None:
+            return max((level for _, level in self._severity_ac.iter(combined_text)), default=None)
+        
+        # Without the automaton, skip keywords whose first letter is absent
+        chars = set(combined_text)
+        for keyword, severity_level in self._flat_severity:
+            if keyword[0] in chars and keyword in combined_text:
+                return severity_level
         
         return None
     
-    def _calculate_chest_pain_severity(self, symptom: Dict, clinical_text: str) -> Optional[int]:
+    def _calculate_chest_pain_severity(
+        self,
+        symptom: Dict,
+        clinical_text: str,
+        kw_severity: Optional[int]
+    ) -> Optional[int]:
         """Calculate severity for chest pain based on quality and characteristics"""
         
         quality = (symptom.get("quality") or "").lower()
         radiation = (symptom.get("radiation") or "").lower()
         
         # Start with keyword-based extraction
-        base_severity = self._extract_severity_from_keywords(symptom, clinical_text)
-        if base_severity is not None:
-            return base_severity
+        if kw_severity is not None:
+            return kw_severity
         
         # Quality-based severity
         severity = 5  # Default moderate
@@ -150,17 +247,21 @@ class SymptomSeverityCalculator:
         
         # Radiation increases severity
         if radiation and any(loc in radiation for loc in ["arm", "jaw", "back", "shoulder"]):
-            severity = min(10, severity + 2)
+            severity += 2
         
-        return severity
+        return min(10, severity)  # Clamp once on exit
     
-    def _calculate_pain_severity(self, symptom: Dict, clinical_text: str) -> Optional[int]:
+    def _calculate_pain_severity(
+        self,
+        symptom: Dict,
+        clinical_text: str,
+        kw_severity: Optional[int]
+    ) -> Optional[int]:
         """Generic pain severity calculation"""
         
         # Try keyword extraction first
-        base_severity = self._extract_severity_from_keywords(symptom, clinical_text)
-        if base_severity is not None:
-            return base_severity
+        if kw_severity is not None:
+            return kw_severity
         
         quality = (symptom.get("quality") or "").lower()
         
@@ -176,13 +277,17 @@ class SymptomSeverityCalculator:
         
         return 5  # Default moderate
     
-    def _calculate_respiratory_severity(self, symptom: Dict, clinical_text: str) -> Optional[int]:
+    def _calculate_respiratory_severity(
+        self,
+        symptom: Dict,
+        clinical_text: str,
+        kw_severity: Optional[int]
+    ) -> Optional[int]:
         """Calculate severity for respiratory symptoms"""
         
         # Try keyword extraction
-        base_severity = self._extract_severity_from_keywords(symptom, clinical_text)
-        if base_severity is not None:
-            return base_severity
+        if kw_severity is not None:
+            return kw_severity
         
         quality = (symptom.get("quality") or "").lower()
         timing = (symptom.get("timing") or "").lower()
@@ -199,12 +304,16 @@ class SymptomSeverityCalculator:
         
         return 6  # Default moderate-high for respiratory complaints
     
-    def _calculate_cough_severity(self, symptom: Dict, clinical_text: str) -> Optional[int]:
+    def _calculate_cough_severity(
+        self,
+        symptom: Dict,
+        clinical_text: str,
+        kw_severity: Optional[int]
+    ) -> Optional[int]:
         """Calculate severity for cough"""
         
-        base_severity = self._extract_severity_from_keywords(symptom, clinical_text)
-        if base_severity is not None:
-            return base_severity
+        if kw_severity is not None:
+            return kw_severity
         
         quality = (symptom.get("quality") or "").lower()
         frequency = (symptom.get("frequency") or "").lower()
@@ -218,30 +327,33 @@ class SymptomSeverityCalculator:
         
         # Frequency
         if "constant" in frequency or "continuous" in frequency:
-            severity = min(10, severity + 2)
+            severity += 2
         elif "frequent" in frequency:
-            severity = min(10, severity + 1)
+            severity += 1
         
-        return severity
+        return min(10, severity)  # Clamp once on exit
     
-    def _calculate_fever_severity(self, symptom: Dict, clinical_text: str) -> Optional[int]:
-        """Calculate severity for fever based on temperature"""
-        
-        # Look for temperature values
-        temp_patterns = [
-            r'(\d{2,3}\.?\d*)\s*°?[Ff]',  # Fahrenheit
-            r'(\d{2}\.?\d*)\s*°?[Cc]',    # Celsius
-            r'temp(?:erature)?:?\s*(\d{2,3}\.?\d*)',
-            r'[Tt]:?\s*(\d{2,3}\.?\d*)'
-        ]
+    def _calculate_fever_severity(
+        self,
+        symptom: Dict,
+        clinical_text: str,
+        kw_severity: Optional[int]
+    ) -> Optional[int]:
+        """Calculate severity for fever based on temperature (kw_severity is not used)"""
         
         quality = (symptom.get("quality") or "").lower()
         combined_text = f"{quality} {clinical_text}".lower()
         
-        for pattern in temp_patterns:
-            match = re.search(pattern, combined_text)
-            if match:
-                temp = float(match.group(1))
+        # Look for temperature values: first reading of each pattern, in one scan
+        first_readings = {}
+        for match in self._fever_re.finditer(combined_text):
+            first_readings.setdefault(match.lastgroup, match.group(match.lastgroup))
+            if len(first_readings) == len(self._fever_groups):
+                break
+        
+        for group in self._fever_groups:
+            if group in first_readings:
+                temp = float(first_readings[group])
                 
                 # Determine if F or C
                 if temp > 50:  # Likely Fahrenheit
@@ -271,12 +383,16 @@ class SymptomSeverityCalculator:
         
         return 5  # Default moderate
     
-    def _calculate_neuro_severity(self, symptom: Dict, clinical_text: str) -> Optional[int]:
+    def _calculate_neuro_severity(
+        self,
+        symptom: Dict,
+        clinical_text: str,
+        kw_severity: Optional[int]
+    ) -> Optional[int]:
         """Calculate severity for neurological symptoms"""
         
-        base_severity = self._extract_severity_from_keywords(symptom, clinical_text)
-        if base_severity is not None:
-            return base_severity
+        if kw_severity is not None:
+            return kw_severity
         
         quality = (symptom.get("quality") or "").lower()
         base_symptom = (symptom.get("base_symptom") or "").lower()
@@ -293,12 +409,16 @@ class SymptomSeverityCalculator:
         
         return 5
     
-    def _calculate_gi_severity(self, symptom: Dict, clinical_text: str) -> Optional[int]:
+    def _calculate_gi_severity(
+        self,
+        symptom: Dict,
+        clinical_text: str,
+        kw_severity: Optional[int]
+    ) -> Optional[int]:
         """Calculate severity for GI symptoms"""
         
-        base_severity = self._extract_severity_from_keywords(symptom, clinical_text)
-        if base_severity is not None:
-            return base_severity
+        if kw_severity is not None:
+            return kw_severity
         
         frequency = (symptom.get("frequency") or "").lower()
         quality = (symptom.get("quality") or "").lower()
@@ -352,5 +472,23 @@ class SymptomSeverityCalculator:
         return 5
 
 
-# Singleton instance
-severity_calculator = SymptomSeverityCalculator()
+# Singleton instance (built on first use)
+_instance: Optional[SymptomSeverityCalculator] = None
+_instance_lock = threading.Lock()
+
+
+def get_severity_calculator() -> SymptomSeverityCalculator:
+    """Return the shared severity calculator, creating it on first call (thread-safe)."""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = SymptomSeverityCalculator()
+    return _instance
+
+
+def __getattr__(name: str):
+    # Keep `from services.severity_calculator import severity_calculator` working, lazily
+    if name == "severity_calculator":
+        return get_severity_calculator()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
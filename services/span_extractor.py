@@ -6,6 +6,11 @@ Extracts exact sentences/spans from input note that justify each symptom.
 import logging
 import re
 
+try:
+    import ahocorasick  # Optional: one-pass multi-symptom sentence matching
+except ImportError:
+    ahocorasick = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -44,17 +49,28 @@ class InputTextSpanExtractor:
         sentences = re.split(r'[.!?]+', normalized_text)
         sentences = [s.strip() for s in sentences if s.strip()]
         
+        # Lowercase each symptom once rather than per sentence
+        symptoms_lower = [symptom.lower() for symptom in symptoms]
+        automaton = self._build_symptom_automaton(symptoms_lower)
+        
         # Find sentences containing any of the symptoms
         matching_sentences = []
+        seen_sentences = set()
         
         for sentence in sentences:
             sentence_lower = sentence.lower()
             
-            # Check if sentence contains any symptom
-            for symptom in symptoms:
-                if symptom.lower() in sentence_lower:
-                    if sentence not in matching_sentences:
-                        matching_sentences.append(sentence)
+            # One automaton pass finds whether any symptom occurs in the sentence
+            if automaton is not None:
+                matched = next(automaton.iter(sentence_lower), None) is not None
+            else:
+                matched = any(symptom in sentence_lower for symptom in symptoms_lower)
+            
+            if matched and sentence not in seen_sentences:
+                seen_sentences.add(sentence)
+                matching_sentences.append(sentence)
+                # Only the first 2 matches are used
+                if len(matching_sentences) == 2:
                     break
         
         if not matching_sentences:
@@ -64,10 +80,26 @@ class InputTextSpanExtractor:
             return "Clinical presentation as described"
         
         # Join up to 2 matching sentences
-        result = ". ".join(matching_sentences[:2])
+        result = ". ".join(matching_sentences)
         
         # Trim if too long
         if len(result) > 200:
             result = result[:197] + "..."
         
         return result
+    
+    def _build_symptom_automaton(self, symptoms_lower: list):
+        """
+        Build an Aho-Corasick automaton over the lowercased symptoms.
+        
+        Returns None when pyahocorasick is unavailable, or when a symptom is
+        empty (it matches every sentence, which the plain loop handles).
+        """
+        if ahocorasick is None or "" in symptoms_lower:
+            return None
+        
+        automaton = ahocorasick.Automaton()
+        for symptom in symptoms_lower:
+            automaton.add_word(symptom, symptom)
+        automaton.make_automaton()
+        return automaton
@@ -6,13 +6,41 @@ Complements MedCaseReasoning with broader symptom coverage.
 
 import logging
 import json
+import os
+import pickle
+import sys
+import threading
+from collections import defaultdict
+from itertools import chain
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+import numpy as np
 from datasets import load_dataset
-from difflib import SequenceMatcher
+from rapidfuzz import fuzz, process
 
 logger = logging.getLogger(__name__)
 
+_DATASET_NAME = "dux-tecblic/symptom-disease-dataset"
+
+# Column name variants, in priority order ('label'/'text' are most common for classification)
+_DISEASE_KEYS = ('label', 'Label', 'disease', 'Disease', 'prognosis')
+_SYMPTOM_KEYS = ('text', 'Text', 'symptom', 'Symptom')
+
+# How long generate_diagnoses waits for the background dataset load
+_READY_TIMEOUT_SECONDS = 30.0
+
+# Bump when the map build or flat index layout changes to invalidate old caches
+_MAP_CACHE_VERSION = 2
+_MAP_CACHE_ATTRS = (
+    'disease_symptom_map',
+    '_disease_ids',
+    '_all_symptoms',
+    '_disease_offsets',
+    '_unique_symptoms',
+    '_symptom_inverse',
+    '_unique_symptom_index',
+)
+
 
 class SymptomDiseaseService:
     """
@@ -26,9 +54,36 @@ class SymptomDiseaseService:
         logger.info("Initializing SymptomDiseaseService...")
         self.dataset = None
         self.disease_symptom_map = {}
+        self._reset_flat_symptom_index()
         self.disease_id_map = {}
         self._load_disease_mapping()
-        self._load_dataset()
+        
+        # Load the dataset off the init path; queries wait on _ready
+        self._ready = threading.Event()
+        threading.Thread(
+            target=self._load_dataset_in_background,
+            name="symptom-disease-load",
+            daemon=True
+        ).start()
+    
+    def ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the background dataset load to finish.
+        
+        Args:
+            timeout: Seconds to wait (None waits indefinitely, 0 just checks)
+            
+        Returns:
+            True once loading has finished (successfully or not)
+        """
+        return self._ready.wait(timeout)
+    
+    def _load_dataset_in_background(self):
+        """Thread target: load the dataset, then release waiting queries."""
+        try:
+            self._load_dataset()
+        finally:
+            self._ready.set()
     
     def _load_disease_mapping(self):
         """Load disease ID to name mapping."""
@@ -43,64 +98,230 @@ class SymptomDiseaseService:
             self.disease_id_map = {}
     
     def _load_dataset(self):
-        """Load symptom-disease dataset from HuggingFace."""
+        """Load symptom-disease dataset from HuggingFace (or the local map cache)."""
+        cache_path = Path(__file__).parent.parent / "config" / "symptom_disease_map.pkl"
+        if self._load_map_cache(cache_path):
+            logger.info(f"✅ Loaded symptom-disease map from cache: {len(self.disease_symptom_map)} unique diseases")
+            return
+        
         try:
             logger.info("Loading symptom-disease dataset from HuggingFace...")
-            self.dataset = load_dataset("dux-tecblic/symptom-disease-dataset")
+            # Stream the train split so rows feed the map build as they download
+            self.dataset = load_dataset(
+                _DATASET_NAME,
+                split="train",
+                streaming=True
+            )
             
             # Build disease → symptoms mapping for fast lookup
             self._build_disease_map()
+            if self.disease_symptom_map:
+                self._save_map_cache(cache_path)
             
             logger.info(f"✅ Loaded symptom-disease dataset: {len(self.disease_symptom_map)} unique diseases")
         except Exception as e:
             logger.error(f"Failed to load symptom-disease dataset: {e}")
             self.dataset = None
             self.disease_symptom_map = {}
+            self._reset_flat_symptom_index()
+    
+    def _load_map_cache(self, cache_path: Path) -> bool:
+        """
+        Restore the disease map and flat symptom index from the pickle cache.
+        
+        The dataset is remote, so there is no mtime to compare against; delete
+        the cache file (or bump _MAP_CACHE_VERSION) to rebuild from HuggingFace.
+        
+        Returns:
+            True if a cache for the current dataset and version was loaded
+        """
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable symptom-disease cache {cache_path}: {e}")
+            return False
+        
+        if (
+            not isinstance(cached, dict)
+            or cached.get('version') != _MAP_CACHE_VERSION
+            or cached.get('dataset') != _DATASET_NAME
+        ):
+            return False
+        
+        for attr in _MAP_CACHE_ATTRS:
+            setattr(self, attr, cached[attr])
+        self._intern_symptom_strings()
+        return True
+    
+    def _intern_symptom_strings(self):
+        """
+        Re-intern cached symptom strings (unpickling does not intern them).
+        
+        Pickle keeps the sharing between the map and the flat index lists,
+        so interning per disease and remapping the lists keeps one object
+        per symptom, identical to the patient symptoms interned per request.
+        """
+        intern = sys.intern
+        
+        self.disease_symptom_map = {
+            disease: tuple(intern(symptom) for symptom in symptoms)
+            for disease, symptoms in self.disease_symptom_map.items()
+        }
+        self._all_symptoms = [intern(symptom) for symptom in self._all_symptoms]
+        self._unique_symptoms = [intern(symptom) for symptom in self._unique_symptoms]
+    
+    def _save_map_cache(self, cache_path: Path):
+        """Write the disease map and flat symptom index to the pickle cache (best effort)."""
+        cached = {attr: getattr(self, attr) for attr in _MAP_CACHE_ATTRS}
+        cached['version'] = _MAP_CACHE_VERSION
+        cached['dataset'] = _DATASET_NAME
+        
+        # Write to a temp file and rename so concurrent workers never read a partial cache
+        tmp_path = cache_path.with_suffix(f'.pkl.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write symptom-disease cache {cache_path}: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
     
     def _build_disease_map(self):
-        """Build a mapping of disease → list of associated symptoms."""
-        if not self.dataset or 'train' not in self.dataset:
+        """Build a mapping of disease → tuple of associated symptoms (dataset order)."""
+        if self.dataset is None:
             return
         
-        logger.info(f"Building mapping from {len(self.dataset['train'])} rows...")
-        
-        for row in self.dataset['train']:
-            # Standard format: 'label' = disease, 'text' = symptom
-            # Try multiple variations
-            disease = (
-                row.get('label') or  # Most common for classification
-                row.get('Label') or
-                row.get('disease') or
-                row.get('Disease') or
-                row.get('prognosis')
-            )
-            
-            symptom = (
-                row.get('text') or  # Most common for classification
-                row.get('Text') or
-                row.get('symptom') or
-                row.get('Symptom')
-            )
-            
-            if disease and symptom:
-                disease = str(disease).strip()
-                symptom = str(symptom).strip().lower().replace('_', ' ')
-                
-                if disease not in self.disease_symptom_map:
-                    self.disease_symptom_map[disease] = set()
+        logger.info("Building mapping from streamed rows...")
+        
+        # dict keys dedupe symptoms while keeping dataset order
+        disease_symptoms = defaultdict(dict)
+        row_count = 0
+        
+        # Standard format: 'label' = disease, 'text' = symptom
+        # Detect which variation the dataset uses once, from the first row
+        rows = iter(self.dataset)
+        first_row = next(rows, None)
+        disease_key = symptom_key = None
+        if first_row is not None:
+            disease_key = next((k for k in _DISEASE_KEYS if k in first_row), None)
+            symptom_key = next((k for k in _SYMPTOM_KEYS if k in first_row), None)
+            if disease_key is None or symptom_key is None:
+                logger.warning(f"Unrecognized symptom-disease columns: {list(first_row)}")
+            rows = chain([first_row], rows)
+        
+        if disease_key is not None and symptom_key is not None:
+            for row in rows:
+                row_count += 1
+                disease = row[disease_key]
+                symptom = row[symptom_key]
                 
-                self.disease_symptom_map[disease].add(symptom)
+                if disease and symptom:
+                    disease = str(disease).strip()
+                    # Interned so exact matches against patient symptoms compare by identity
+                    symptom = sys.intern(str(symptom).strip().lower().replace('_', ' '))
+                    disease_symptoms[disease][symptom] = None
         
-        # Convert sets to lists
+        logger.info(f"Streamed {row_count} rows")
+        
+        # Freeze each disease's symptoms as a tuple
         self.disease_symptom_map = {
-            disease: list(symptoms)
-            for disease, symptoms in self.disease_symptom_map.items()
+            disease: tuple(symptoms)
+            for disease, symptoms in disease_symptoms.items()
         }
         
+        self._build_flat_symptom_index()
+        
         if self.disease_symptom_map:
             avg_symptoms = sum(len(s) for s in self.disease_symptom_map.values()) / len(self.disease_symptom_map)
             logger.info(f"Mapped {len(self.disease_symptom_map)} diseases, avg {avg_symptoms:.1f} symptoms/disease")
     
+    def _reset_flat_symptom_index(self):
+        """Empty flat symptom index (no dataset loaded)."""
+        self._disease_ids = []
+        self._all_symptoms = []
+        self._disease_offsets = np.zeros(0, dtype=np.intp)
+        self._unique_symptoms = []
+        self._symptom_inverse = np.zeros(0, dtype=np.intp)
+        self._unique_symptom_index = self._build_substring_index([])
+    
+    def _build_flat_symptom_index(self):
+        """
+        Flatten every disease's symptoms into one list for batch scoring.
+        
+        Disease i owns columns _disease_offsets[i] up to the next offset, so
+        per-disease reductions are a single np.*.reduceat over the columns.
+        Diseases without symptoms are left out (they can never score).
+        
+        Symptoms shared by several diseases are scored once: _unique_symptoms
+        holds each string once and _symptom_inverse maps flat columns to it.
+        """
+        self._reset_flat_symptom_index()
+        offsets = []
+        for disease, symptoms in self.disease_symptom_map.items():
+            if symptoms:
+                self._disease_ids.append(disease)
+                offsets.append(len(self._all_symptoms))
+                self._all_symptoms.extend(symptoms)
+        self._disease_offsets = np.array(offsets, dtype=np.intp)
+        
+        unique_position = {}
+        for symptom in self._all_symptoms:
+            unique_position.setdefault(symptom, len(unique_position))
+        self._unique_symptoms = list(unique_position)
+        self._symptom_inverse = np.array(
+            [unique_position[symptom] for symptom in self._all_symptoms], dtype=np.intp
+        )
+        # Static substring index over the unique symptoms, reused by every query
+        self._unique_symptom_index = self._build_substring_index(self._unique_symptoms)
+    
+    def _flat_similarity_matrix(self, queries: List[str]) -> np.ndarray:
+        """
+        _similarity_matrix scores of queries against every disease symptom at once.
+        
+        Each distinct symptom string is scored once (exact/substring overlay
+        included), then expanded to the flat per-disease column layout.
+        
+        Returns:
+            Similarity matrix of shape (len(queries), len(_all_symptoms))
+        """
+        unique_similarity = self._similarity_matrix(
+            queries,
+            self._unique_symptoms,
+            substring_index=self._unique_symptom_index
+        )
+        return unique_similarity[:, self._symptom_inverse]
+    
+    @staticmethod
+    def _top_k_indices(scores: np.ndarray, top_k: int) -> List[int]:
+        """
+        Indices of the top_k positive scores, highest first.
+        
+        Partial selection with np.argpartition, then only the selected slice is
+        sorted. Ties keep index order (same as a stable descending sort).
+        """
+        candidates = np.flatnonzero(scores > 0.0)  # Only include if there's some match
+        if top_k <= 0 or candidates.size == 0:
+            return []
+        
+        candidate_scores = scores[candidates]
+        if candidates.size > top_k:
+            # Everything strictly above the k-th best score, then fill with the
+            # earliest indices tied at that score
+            kth_score = candidate_scores[np.argpartition(-candidate_scores, top_k - 1)[top_k - 1]]
+            above = candidates[candidate_scores > kth_score]
+            tied = candidates[candidate_scores == kth_score][:top_k - above.size]
+            candidates = np.concatenate([above, tied])
+            candidate_scores = scores[candidates]
+        
+        order = np.lexsort((candidates, -candidate_scores))
+        return candidates[order].tolist()
+    
     def generate_diagnoses(
         self,
         patient_symptoms: List[str],
@@ -118,42 +339,55 @@ class SymptomDiseaseService:
         Returns:
             List of diagnosis dictionaries with reasoning
         """
+        if not self.ready(_READY_TIMEOUT_SECONDS):
+            logger.warning("Symptom-disease dataset still loading, returning empty results")
+            return []
+        
         if not self.disease_symptom_map:
             logger.warning("Symptom-disease dataset not loaded, returning empty results")
             return []
         
-        # Normalize patient symptoms
-        normalized_patient_symptoms = [s.lower().strip() for s in patient_symptoms]
+        # Normalize patient symptoms (interned like the dataset symptoms)
+        normalized_patient_symptoms = [sys.intern(s.lower().strip()) for s in patient_symptoms]
         
         # Normalize negations
-        normalized_negations = [s.lower().strip() for s in (negations or [])]
+        normalized_negations = [sys.intern(s.lower().strip()) for s in (negations or [])]
         
         # Score all diseases
-        disease_scores = []
+        top_diseases = []
         
-        for disease, disease_symptoms in self.disease_symptom_map.items():
-            score = self._calculate_symptom_match_score(
-                normalized_patient_symptoms,
-                disease_symptoms,
-                normalized_negations  # Pass negations
-            )
+        if normalized_patient_symptoms and self._all_symptoms:
+            # One patient x all-symptoms matrix, reduced per disease segment
+            similarity = self._flat_similarity_matrix(normalized_patient_symptoms)
+            best = np.maximum.reduceat(similarity, self._disease_offsets, axis=1)
+            
+            # Average best match per patient symptom, boosted by coverage
+            n_patient = len(normalized_patient_symptoms)
+            coverage_boost = n_patient / (n_patient + 2)
+            scores = best.sum(axis=0) / n_patient * coverage_boost
+            
+            # APPLY NEGATION PENALTY (-15% per negated key symptom)
+            if normalized_negations:
+                negated = self._flat_similarity_matrix(normalized_negations) >= 0.7
+                negated_counts = np.add.reduceat(negated.astype(np.int64), self._disease_offsets, axis=1).sum(axis=0)
+                scores = np.maximum(scores - 0.15 * negated_counts, 0.0)
             
-            if score > 0.0:  # Only include if there's some match
-                disease_scores.append({
+            scores = np.minimum(scores, 1.0)
+            bounds = self._disease_offsets.tolist() + [len(self._all_symptoms)]
+            
+            # Top K by score (descending), ties in dataset order; only those are formatted
+            for k in self._top_k_indices(scores, top_k):
+                disease = self._disease_ids[k]
+                top_diseases.append({
                     'disease': disease,
-                    'score': score,
+                    'score': float(scores[k]),
                     'matched_symptoms': self._find_matched_symptoms(
                         normalized_patient_symptoms,
-                        disease_symptoms
+                        self.disease_symptom_map[disease],
+                        similarity=similarity[:, bounds[k]:bounds[k + 1]]
                     )
                 })
         
-        # Sort by score (descending)
-        disease_scores.sort(key=lambda x: x['score'], reverse=True)
-        
-        # Take top K
-        top_diseases = disease_scores[:top_k]
-        
         # Format as diagnosis objects
         diagnoses = []
         for idx, match in enumerate(top_diseases, 1):
@@ -185,108 +419,87 @@ class SymptomDiseaseService:
         logger.info(f"Generated {len(diagnoses)} diagnoses from symptom-disease dataset")
         return diagnoses
     
-    def _calculate_symptom_match_score(
+    def _similarity_matrix(
         self,
-        patient_symptoms: List[str],
-        disease_symptoms: List[str],
-        negations: List[str] = None
-    ) -> float:
+        queries: List[str],
+        candidates: List[str],
+        threshold: float = 0.4,
+        substring_index: Optional[Tuple[str, int]] = None
+    ) -> np.ndarray:
         """
-        Calculate semantic similarity score between patient and disease symptoms.
-        Uses fuzzy string matching (not vector similarity).
+        Fuzzy symptom similarity (0.0-1.0) for every (query, candidate) pair at once.
         
-        APPLIES NEGATION PENALTY: If patient denies a key disease symptom, score decreases.
+        Exact match scores 1.0, substring match 0.9, otherwise the normalized
+        InDel ratio when it reaches threshold (0.0 below it). Fuzzy ratios come
+        from a single RapidFuzz cdist call (C++); exact and substring matches
+        are then overlaid. With a substring index for the candidates, queries
+        that cannot be in a substring relation with any candidate skip the
+        overlay loop.
         
-        Args:
-            patient_symptoms: Patient's symptoms (normalized)
-            disease_symptoms: Disease's known symptoms (normalized)
-            negations: Patient's denied symptoms
-            
         Returns:
-            Match score (0.0-1.0)
+            Similarity matrix of shape (len(queries), len(candidates))
         """
-        if not patient_symptoms or not disease_symptoms:
-            return 0.0
-        
-        total_match_score = 0.0
-        
-        for patient_symptom in patient_symptoms:
-            # Find best match for this patient symptom among disease symptoms
-            best_match_score = 0.0
-            
-            for disease_symptom in disease_symptoms:
-                # Use fuzzy string matching (Sequence Matcher)
-                similarity = self._fuzzy_match(patient_symptom, disease_symptom)
-                
-                if similarity > best_match_score:
-                    best_match_score = similarity
-            
-            total_match_score += best_match_score
-        
-        # Normalize by number of patient symptoms
-        average_match = total_match_score / len(patient_symptoms)
-        
-        # Boost if many symptoms match
-        coverage_boost = len(patient_symptoms) / (len(patient_symptoms) + 2)
-        
-        final_score = average_match * coverage_boost
-        
-        # APPLY NEGATION PENALTY
-        if negations:
-            negation_penalty = 0.0
-            for negation in negations:
-                for disease_symptom in disease_symptoms:
-                    if self._fuzzy_match(negation, disease_symptom) >= 0.7:
-                        negation_penalty += 0.15  # -15% per negated key symptom
-            
-            final_score = max(final_score - negation_penalty, 0.0)
-        
-        return min(final_score, 1.0)
+        similarity = process.cdist(
+            queries,
+            candidates,
+            scorer=fuzz.ratio,
+            score_cutoff=threshold * 100,
+            dtype=np.float64
+        ) / 100.0
+        
+        if substring_index is None:
+            substring_index = self._build_substring_index(candidates)
+        blob, min_length = substring_index
+        
+        for i, query in enumerate(queries):
+            # Query inside some candidate needs it in the blob; a candidate inside
+            # the query needs the query to be at least as long as that candidate
+            if query not in blob and len(query) < min_length:
+                continue
+            for j, candidate in enumerate(candidates):
+                if query == candidate:
+                    similarity[i, j] = 1.0
+                elif query in candidate or candidate in query:
+                    similarity[i, j] = 0.9
+        
+        return similarity
     
-    def _fuzzy_match(self, str1: str, str2: str, threshold: float = 0.4) -> float:
-        """
-        Calculate fuzzy string similarity (0.0-1.0).
-        Lowered threshold to 0.4 for better matching with simple symptom terms.
-        
-        Args:
-            str1: First string
-            str2: Second string
-            threshold: Minimum similarity to consider a match (default 0.4)
-            
-        Returns:
-            Similarity score
-        """
-        # Exact match
-        if str1 == str2:
-            return 1.0
-        
-        # Substring check
-        if str1 in str2 or str2 in str1:
-            return 0.9
-        
-        # Fuzzy matching
-        similarity = SequenceMatcher(None, str1, str2).ratio()
-        
-        return similarity if similarity >= threshold else 0.0
+    @staticmethod
+    def _build_substring_index(candidates: List[str]) -> Tuple[str, int]:
+        """Newline-joined candidates and the shortest candidate length."""
+        return "\n".join(candidates), min((len(c) for c in candidates), default=0)
     
     def _find_matched_symptoms(
         self,
         patient_symptoms: List[str],
-        disease_symptoms: List[str]
+        disease_symptoms: List[str],
+        similarity: Optional[np.ndarray] = None
     ) -> List[str]:
         """
         Find which patient symptoms matched with disease symptoms.
         
+        Args:
+            patient_symptoms: Patient's symptoms (normalized)
+            disease_symptoms: Disease's known symptoms (normalized)
+            similarity: Precomputed _similarity_matrix(patient_symptoms, disease_symptoms)
+        
         Returns:
             List of matched symptom pairs
         """
+        if not patient_symptoms or not disease_symptoms:
+            return []
+        
+        if similarity is None:
+            similarity = self._similarity_matrix(patient_symptoms, disease_symptoms)
+        
         matched = []
+        hits = similarity >= 0.5  # Lowered from 0.7
         
-        for patient_symptom in patient_symptoms:
-            for disease_symptom in disease_symptoms:
-                if self._fuzzy_match(patient_symptom, disease_symptom) >= 0.5:  # Lowered from 0.7
-                    matched.append(f"{patient_symptom} → {disease_symptom}")
-                    break  # One match per patient symptom
+        for i, patient_symptom in enumerate(patient_symptoms):
+            row = hits[i]
+            if row.any():
+                j = int(row.argmax())  # First match: one per patient symptom
+                matched.append(f"{patient_symptom} → {disease_symptoms[j]}")
         
         return matched[:5]  # Limit to top 5
     
@@ -5,11 +5,17 @@ Maps extracted symptoms to CSV columns and DDXPlus evidence IDs
 
 import logging
 import json
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from fuzzywuzzy import fuzz, process
+from rapidfuzz import fuzz, process, utils
 from typing import Dict, List, Optional
 
+try:
+    import ahocorasick  # Optional: single-pass evidence keyword scan
+except ImportError:
+    ahocorasick = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,7 +26,13 @@ class CSVSymptomMapper:
         """Initialize with CSV file"""
         self.csv_path = csv_path
         self.symptom_columns = self._load_columns()
+        self._col_to_idx = {column: i for i, column in enumerate(self.symptom_columns)}
         self.synonyms = self._build_synonyms()
+        # Columns as seen by the fuzzy scorers (lowercased, punctuation stripped)
+        self._processed_columns = [utils.default_process(c) for c in self.symptom_columns]
+        # Exact and synonym lookups in one dict; exact column names take precedence
+        self._lookup = {key.lower(): column for key, column in self.synonyms.items()}
+        self._lookup.update((column.lower(), column) for column in self.symptom_columns)
         logger.info(f"CSV Mapper initialized with {len(self.symptom_columns)} symptoms")
     
     def _load_columns(self) -> List[str]:
@@ -76,45 +88,67 @@ class CSVSymptomMapper:
         Returns:
             Matched CSV column name or None
         """
-        if not symptom_text:
-            return None
-        
-        symptom_lower = symptom_text.lower().strip()
+        return self.map_symptoms([symptom_text])[0]
+    
+    def map_symptoms(self, symptom_texts: List[str]) -> List[Optional[str]]:
+        """
+        Map several symptoms to CSV column names in one batch.
         
-        # Strategy 1: Exact match
-        if symptom_lower in self.symptom_columns:
-            return symptom_lower
+        Exact and synonym hits are one dict lookup per symptom; the rest are scored
+        against all columns with one RapidFuzz cdist call per fuzzy strategy.
         
-        # Strategy 2: Synonym lookup
-        if symptom_lower in self.synonyms:
-            return self.synonyms[symptom_lower]
+        Args:
+            symptom_texts: Symptom descriptions
         
-        # Strategy 3: Fuzzy matching
-        match, score = process.extractOne(
-            symptom_lower, 
-            self.symptom_columns,
-            scorer=fuzz.ratio
-        )
+        Returns:
+            Matched CSV column name (or None) for each symptom, in order
+        """
+        matches: List[Optional[str]] = [None] * len(symptom_texts)
+        fuzzy_rows = []
         
-        if score > 85:  # High confidence
-            logger.debug(f"Fuzzy matched '{symptom_text}' → '{match}' (score {score})")
-            return match
+        for i, symptom_text in enumerate(symptom_texts):
+            if not symptom_text:
+                continue
+            
+            # Strategies 1-2: Exact match / synonym lookup
+            column = self._lookup.get(symptom_text.lower().strip())
+            if column is not None:
+                matches[i] = column
+            else:
+                fuzzy_rows.append(i)
         
-        # Strategy 4: Partial matching (for compound symptoms)
-        match, score = process.extractOne(
-            symptom_lower,
-            self.symptom_columns,
-            scorer=fuzz.partial_ratio
-        )
+        if fuzzy_rows and self.symptom_columns:
+            # Strategy 3: Fuzzy matching; Strategy 4: Partial matching (for compound symptoms)
+            for scorer, min_score, label in (
+                (fuzz.ratio, 85, "Fuzzy"),  # High confidence
+                (fuzz.partial_ratio, 90, "Partial")
+            ):
+                if not fuzzy_rows:
+                    break
+                scores = process.cdist(
+                    [utils.default_process(symptom_texts[i]) for i in fuzzy_rows],
+                    self._processed_columns,
+                    scorer=scorer,
+                    score_cutoff=min_score
+                )
+                best_columns = scores.argmax(axis=1)
+                best_scores = scores[np.arange(len(fuzzy_rows)), best_columns]
+                
+                unmatched = []
+                for row, i in enumerate(fuzzy_rows):
+                    if best_scores[row] > min_score:
+                        matches[i] = self.symptom_columns[best_columns[row]]
+                        logger.debug(f"{label} matched '{symptom_texts[i]}' → '{matches[i]}' (score {best_scores[row]:.0f})")
+                    else:
+                        unmatched.append(i)
+                fuzzy_rows = unmatched
         
-        if score > 90:
-            logger.debug(f"Partial matched '{symptom_text}' → '{match}' (score {score})")
-            return match
+        for i in fuzzy_rows:
+            logger.warning(f"No match found for symptom: {symptom_texts[i]}")
         
-        logger.warning(f"No match found for symptom: {symptom_text}")
-        return None
+        return matches
     
-    def create_binary_vector(self, symptoms: List[Dict]) -> List[int]:
+    def create_binary_vector(self, symptoms: List[Dict]) -> np.ndarray:
         """
         Create 377-length binary vector for CSV matching.
         
@@ -122,19 +156,18 @@ class CSVSymptomMapper:
             symptoms: List of symptom dicts with 'symptom' key
         
         Returns:
-            Binary vector [0,0,1,0,1,...]
+            Binary uint8 vector [0,0,1,0,1,...]
         """
-        vector = [0] * len(self.symptom_columns)
+        vector = np.zeros(len(self.symptom_columns), dtype=np.uint8)
         
-        for symptom_dict in symptoms:
-            symptom_text = symptom_dict.get("symptom", "")
-            matched_column = self.map_symptom(symptom_text)
-            
-            if matched_column and matched_column in self.symptom_columns:
-                idx = self.symptom_columns.index(matched_column)
+        matched_columns = self.map_symptoms([s.get("symptom", "") for s in symptoms])
+        
+        for matched_column in matched_columns:
+            idx = self._col_to_idx.get(matched_column)
+            if idx is not None:
                 vector[idx] = 1
         
-        logger.info(f"Created binary vector: {sum(vector)} symptoms matched")
+        logger.info(f"Created binary vector: {int(vector.sum())} symptoms matched")
         return vector
 
 
@@ -179,6 +212,9 @@ class AnatomicalLocationMapper:
             "neck": "V_26",
             "head": "V_62",
         }
+        # Fuzzy-match choices, frozen and preprocessed once (lowercased, punctuation stripped)
+        self._location_keys = tuple(self.location_map)
+        self._processed_location_keys = [utils.default_process(k) for k in self._location_keys]
     
     def map_location(self, location_text: str) -> str:
         """Map location to V_XXX code"""
@@ -192,15 +228,15 @@ class AnatomicalLocationMapper:
             return self.location_map[location_lower]
         
         # Fuzzy match
-        matches = process.extract(
-            location_lower,
-            list(self.location_map.keys()),
+        best = process.extractOne(
+            utils.default_process(location_lower),
+            self._processed_location_keys,
             scorer=fuzz.partial_ratio,
-            limit=1
+            score_cutoff=80
         )
         
-        if matches and matches[0][1] > 80:
-            matched_key = matches[0][0]
+        if best is not None and best[1] > 80:
+            matched_key = self._location_keys[best[2]]
             return self.location_map[matched_key]
         
         return "V_123"  # nowhere (default)
@@ -213,6 +249,14 @@ class DDXPlusEvidenceMapper:
         """Initialize with evidences file"""
         self.evidences = self._load_evidences(evidences_path)
         self.location_mapper = AnatomicalLocationMapper()
+        self.keyword_map = self._build_keyword_map()
+        self._keyword_automaton = self._build_keyword_automaton()
+        # Parallel lists of evidence IDs and lowercased questions for batch fuzzy matching
+        self._evidence_ids = list(self.evidences)
+        self._questions = [
+            self.evidences[e_id].get("question_en", "").lower()
+            for e_id in self._evidence_ids
+        ]
         logger.info(f"DDXPlus Mapper initialized with {len(self.evidences)} evidences")
     
     def _load_evidences(self, path: str) -> Dict:
@@ -236,12 +280,12 @@ class DDXPlusEvidenceMapper:
         """
         evidence_profile = {}
         
-        for symptom_dict in symptoms:
-            symptom_text = symptom_dict.get("symptom", "").lower()
-            
-            # Find matching evidence ID
-            evidence_id = self._find_evidence_id(symptom_text)
-            
+        # Find matching evidence IDs for the whole batch at once
+        evidence_ids = self._find_evidence_ids(
+            [symptom_dict.get("symptom", "").lower() for symptom_dict in symptoms]
+        )
+        
+        for symptom_dict, evidence_id in zip(symptoms, evidence_ids):
             if not evidence_id:
                 continue
             
@@ -270,11 +314,9 @@ class DDXPlusEvidenceMapper:
         logger.info(f"Mapped to {len(evidence_profile)} evidences")
         return evidence_profile
     
-    def _find_evidence_id(self, symptom_text: str) -> Optional[str]:
-        """Find evidence ID by matching symptom to questions"""
-        
-        # Keyword mapping
-        keyword_map = {
+    def _build_keyword_map(self) -> Dict[str, str]:
+        """Build keyword → evidence ID map (earlier keywords take priority)"""
+        return {
             "pain": "E_53",
             "chest pain": "E_55",
             "fever": "E_91",
@@ -289,25 +331,67 @@ class DDXPlusEvidenceMapper:
             "sweating": "E_50",
             "diaphoresis": "E_50",
         }
+    
+    def _build_keyword_automaton(self):
+        """
+        Aho-Corasick automaton over the keyword map: keyword → (priority, evidence ID).
         
-        # Try keyword match first
-        for keyword, e_id in keyword_map.items():
-            if keyword in symptom_text:
-                return e_id
+        Returns None when pyahocorasick is not installed.
+        """
+        if ahocorasick is None:
+            return None
+        
+        automaton = ahocorasick.Automaton()
+        for priority, (keyword, e_id) in enumerate(self.keyword_map.items()):
+            automaton.add_word(keyword, (priority, e_id))
+        automaton.make_automaton()
+        return automaton
+    
+    def _find_evidence_id(self, symptom_text: str) -> Optional[str]:
+        """Find evidence ID by matching symptom to questions"""
+        return self._find_evidence_ids([symptom_text])[0]
+    
+    def _find_evidence_ids(self, symptom_texts: List[str]) -> List[Optional[str]]:
+        """
+        Find evidence IDs for several lowercased symptoms in one batch.
         
-        # Fuzzy match against questions
-        best_match_id = None
-        best_score = 0
+        Keyword hits short-circuit per symptom; the rest are scored against
+        all questions with a single RapidFuzz cdist call.
+        """
+        evidence_ids: List[Optional[str]] = [None] * len(symptom_texts)
+        fuzzy_rows = []
+        
+        for i, symptom_text in enumerate(symptom_texts):
+            evidence_id = self._find_keyword_evidence_id(symptom_text)
+            if evidence_id is not None:
+                evidence_ids[i] = evidence_id
+            else:
+                fuzzy_rows.append(i)
         
-        for e_id, data in self.evidences.items():
-            question = data.get("question_en", "").lower()
-            score = fuzz.partial_ratio(symptom_text, question)
+        if fuzzy_rows and self._questions:
+            # Fuzzy match against questions (first best question wins)
+            scores = process.cdist(
+                [symptom_texts[i] for i in fuzzy_rows],
+                self._questions,
+                scorer=fuzz.partial_ratio,
+                score_cutoff=70
+            )
+            best_questions = scores.argmax(axis=1)
+            best_scores = scores[np.arange(len(fuzzy_rows)), best_questions]
             
-            if score > best_score:
-                best_score = score
-                best_match_id = e_id
+            for row, i in enumerate(fuzzy_rows):
+                if best_scores[row] > 70:
+                    evidence_ids[i] = self._evidence_ids[best_questions[row]]
         
-        if best_score > 70:
-            return best_match_id
+        return evidence_ids
+    
+    def _find_keyword_evidence_id(self, symptom_text: str) -> Optional[str]:
+        """Keyword match: one pass finds every keyword, the highest-priority one wins"""
+        if self._keyword_automaton is not None:
+            hit = min((value for _, value in self._keyword_automaton.iter(symptom_text)), default=None)
+            return hit[1] if hit is not None else None
         
+        for keyword, e_id in self.keyword_map.items():
+            if keyword in symptom_text:
+                return e_id
         return None
@@ -11,12 +11,79 @@ Ensures:
 """
 
 import logging
-from typing import List, Dict, Tuple, Optional
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from typing import List, Dict, NamedTuple, Tuple, Optional
 import re
+import numpy as np
 from models.schemas import ConfidenceScore
 
+try:
+    import ahocorasick  # Optional: one-pass contradictory-term scan
+except ImportError:
+    ahocorasick = None
+
+try:
+    import hyperscan  # Optional: one DFA scan over all citation reasonings
+except ImportError:
+    hyperscan = None
+
 logger = logging.getLogger(__name__)
 
+# Confidence weights shared by the single and batch scorers
+_EVIDENCE_WEIGHT = 0.5
+_REASONING_WEIGHT = 0.3
+_CITATION_WEIGHT = 0.2
+_REASONING_ONLY_WEIGHT = 0.6  # No citations: reasoning consistency alone
+_BASELINE_EVIDENCE_STRENGTH = 0.3  # No usable external evidence
+_CITATION_SATURATION = 5.0  # Citation count that earns the full citation weight
+
+# Known contradictory diagnosis qualifiers (simplified)
+_CONTRADICTORY_PAIRS = (
+    ("acute", "chronic"),
+    ("bacterial", "viral"),
+    ("benign", "malignant"),
+)
+
+
+class _ConfidenceValues(NamedTuple):
+    """Rounded confidence fields, unvalidated (promote with ConfidenceScore(**values._asdict()))."""
+    overall_confidence: float
+    evidence_strength: float
+    reasoning_consistency: float
+    citation_count: int
+
+
+@lru_cache(maxsize=4096)
+def _casefold_diagnosis(name: str) -> str:
+    """Caseless form of a diagnosis name (memoized: names recur across requests)."""
+    return name.casefold()
+
+
+def _record_match_end(pattern_id, start, end, flags, match_ends):
+    """Hyperscan match callback: collect match end offsets."""
+    match_ends.append(end)
+
+
+# Byte -> is ASCII alphanumeric, for counting over encoded ASCII text
+_ALNUM_LUT = np.zeros(256, dtype=np.bool_)
+for _lo, _hi in (('0', '9'), ('A', 'Z'), ('a', 'z')):
+    _ALNUM_LUT[ord(_lo):ord(_hi) + 1] = True
+
+
+def _count_alphanumeric(text: str) -> int:
+    """
+    Count alphanumeric characters (str.isalnum semantics).
+    
+    ASCII text is counted with one vectorized table lookup over its bytes;
+    other text keeps the per-character check so Unicode letters still count.
+    """
+    if text.isascii():
+        return int(np.count_nonzero(_ALNUM_LUT[np.frombuffer(text.encode('ascii'), dtype=np.uint8)]))
+    return sum(c.isalnum() for c in text)
+
 
 class ValidationService:
     """
@@ -28,6 +95,11 @@ class ValidationService:
     
     def __init__(self):
         """Initialize validation service."""
+        # Evidence citation marker the LLM is asked to use, e.g. [EVIDENCE 2]
+        self._evidence_cite_re = re.compile(r'\[EVIDENCE \d+\]', re.IGNORECASE)
+        self._evidence_cite_db = self._build_evidence_cite_database()
+        self._hyperscan_local = threading.local()  # Per-thread scan scratch space
+        self._contradiction_automaton = self._build_contradiction_automaton()
         logger.info("ValidationService initialized")
     
     def validate_input_quality(self, text: str) -> Tuple[bool, Optional[str]]:
@@ -51,14 +123,14 @@ class ValidationService:
             return False, "Input text too long (maximum 50,000 characters)"
         
         # Check for meaningful content (not just special characters)
-        alphanumeric_count = sum(c.isalnum() for c in text)
+        alphanumeric_count = _count_alphanumeric(text)
         alphanumeric_ratio = alphanumeric_count / len(text)
         
         if alphanumeric_ratio < 0.5:
             return False, "Input contains insufficient meaningful content"
         
-        # Check for minimum word count
-        words = text.split()
+        # Check for minimum word count (only the first few words need splitting off)
+        words = text.split(maxsplit=5)
         if len(words) < 5:
             return False, "Input too short (minimum 5 words required)"
         
@@ -94,16 +166,18 @@ class ValidationService:
         if len(retrieved_evidence) < min_evidence_count:
             return False, f"Limited evidence retrieved ({len(retrieved_evidence)} chunks) - confidence may be lower"
         
-        # Check similarity scores
-        high_quality_evidence = [
-            e for e in retrieved_evidence
-            if e.get("similarity_score", 0) >= min_similarity_threshold
-        ]
+        # Check similarity scores (stop counting once enough are found)
+        high_quality_count = 0
+        for e in retrieved_evidence:
+            if e.get("similarity_score", 0) >= min_similarity_threshold:
+                high_quality_count += 1
+                if high_quality_count >= min_evidence_count:
+                    break
         
-        if len(high_quality_evidence) < min_evidence_count:
-            return False, f"Limited high-quality evidence ({len(high_quality_evidence)} relevant chunks) - diagnoses rely more on clinical reasoning"
+        if high_quality_count < min_evidence_count:
+            return False, f"Limited high-quality evidence ({high_quality_count} relevant chunks) - diagnoses rely more on clinical reasoning"
         
-        logger.info(f"Evidence sufficiency check passed: {len(retrieved_evidence)} chunks")
+        logger.info("Evidence sufficiency check passed: %d chunks", len(retrieved_evidence))
         return True, None
     
     def check_contradictory_diagnoses(
@@ -123,29 +197,49 @@ class ValidationService:
         """
         warnings = []
         
-        # Define known contradictory pairs (simplified)
-        contradictory_pairs = [
-            ("acute", "chronic"),
-            ("bacterial", "viral"),
-            ("benign", "malignant")
-        ]
-        
-        diagnosis_texts = [d.get("diagnosis", "").lower() for d in diagnoses]
+        # casefold: caseless matching that also folds non-ASCII text
+        diagnosis_texts = [_casefold_diagnosis(d.get("diagnosis", "")) for d in diagnoses]
         
-        for term1, term2 in contradictory_pairs:
-            has_term1 = any(term1 in text for text in diagnosis_texts)
-            has_term2 = any(term2 in text for text in diagnosis_texts)
-            
-            if has_term1 and has_term2:
+        if self._contradiction_automaton is not None:
+            # One scan over all diagnoses (terms never contain the newline separator)
+            found_terms = {
+                term for _, term in self._contradiction_automaton.iter("\n".join(diagnosis_texts))
+            }
+        else:
+            found_terms = {
+                term
+                for pair in _CONTRADICTORY_PAIRS
+                for term in pair
+                if any(term in text for text in diagnosis_texts)
+            }
+        
+        for term1, term2 in _CONTRADICTORY_PAIRS:
+            if term1 in found_terms and term2 in found_terms:
                 warnings.append(
                     f"Potentially contradictory diagnoses: both '{term1}' and '{term2}' conditions suggested"
                 )
         
         if warnings:
-            logger.warning(f"Found {len(warnings)} potential contradictions")
+            logger.warning("Found %d potential contradictions", len(warnings))
         
         return len(warnings) > 0, warnings
     
+    def _build_contradiction_automaton(self):
+        """
+        Aho-Corasick automaton over every contradictory-pair term.
+        
+        Returns None when pyahocorasick is not installed.
+        """
+        if ahocorasick is None:
+            return None
+        
+        automaton = ahocorasick.Automaton()
+        for pair in _CONTRADICTORY_PAIRS:
+            for term in pair:
+                automaton.add_word(term, term)
+        automaton.make_automaton()
+        return automaton
+    
     def validate_llm_citations(
         self,
         diagnoses: List[Dict],
@@ -165,9 +259,15 @@ class ValidationService:
         """
         warnings = []
         
-        available_evidence_ids = set(
-            e.get("chunk_id") for e in available_evidence
-        )
+        # Check if citations are valid
+        # Note: LLM might reference by number [EVIDENCE N]
+        # We check if reasoning mentions evidence (all reasonings scanned at once)
+        cited = self._find_evidence_citations([
+            dx.get("reasoning", "")
+            for dx in diagnoses
+            if dx.get("evidence_references", [])
+        ])
+        cited_iter = iter(cited)
         
         for idx, dx in enumerate(diagnoses):
             evidence_refs = dx.get("evidence_references", [])
@@ -178,20 +278,74 @@ class ValidationService:
                 )
                 continue
             
-            # Check if citations are valid
-            # Note: LLM might reference by number [EVIDENCE N]
-            # We check if reasoning mentions evidence
-            reasoning = dx.get("reasoning", "")
-            if not re.search(r'\[EVIDENCE \d+\]', reasoning, re.IGNORECASE):
+            if not next(cited_iter):
                 warnings.append(
                     f"Diagnosis {idx + 1} reasoning does not cite evidence properly"
                 )
         
         if warnings:
-            logger.warning(f"Citation validation issues: {len(warnings)}")
+            logger.warning("Citation validation issues: %d", len(warnings))
         
         return len(warnings) == 0, warnings
     
+    def _find_evidence_citations(self, reasonings: List[str]) -> List[bool]:
+        """
+        Whether each reasoning contains an [EVIDENCE N] citation.
+        
+        With hyperscan installed, ASCII reasonings are newline-joined and
+        scanned in one pass (a citation never spans the separator); match end
+        offsets map back to reasonings by bisection. Other reasonings use the
+        compiled regex, whose Unicode digit/case rules hyperscan lacks.
+        """
+        cited = [False] * len(reasonings)
+        scan_rows = []
+        
+        for i, reasoning in enumerate(reasonings):
+            if self._evidence_cite_db is not None and reasoning.isascii():
+                scan_rows.append(i)
+            else:
+                cited[i] = self._evidence_cite_re.search(reasoning) is not None
+        
+        if scan_rows:
+            match_ends = []
+            self._evidence_cite_db.scan(
+                "\n".join(reasonings[i] for i in scan_rows).encode("ascii"),
+                match_event_handler=_record_match_end,
+                context=match_ends,
+                scratch=self._hyperscan_scratch()
+            )
+            # Offset just past each reasoning's separator
+            boundaries = list(accumulate(len(reasonings[i]) + 1 for i in scan_rows))
+            for end in match_ends:
+                cited[scan_rows[bisect_right(boundaries, end - 1)]] = True
+        
+        return cited
+    
+    def _build_evidence_cite_database(self):
+        """
+        Hyperscan database for the evidence-citation pattern.
+        
+        Returns None when hyperscan is not installed.
+        """
+        if hyperscan is None:
+            return None
+        
+        database = hyperscan.Database()
+        database.compile(
+            expressions=[br'\[EVIDENCE \d+\]'],
+            ids=[0],
+            flags=[hyperscan.HS_FLAG_CASELESS]
+        )
+        return database
+    
+    def _hyperscan_scratch(self):
+        """Scratch space for the calling thread (hyperscan scratch is not shareable)."""
+        scratch = getattr(self._hyperscan_local, "scratch", None)
+        if scratch is None:
+            scratch = hyperscan.Scratch(self._evidence_cite_db)
+            self._hyperscan_local.scratch = scratch
+        return scratch
+    
     def compute_confidence_score(
         self,
         diagnosis: Dict,
@@ -220,6 +374,29 @@ class ValidationService:
         Returns:
             ConfidenceScore object
         """
+        confidence_score = ConfidenceScore(
+            **self._compute_confidence_values(diagnosis, evidence_chunks, llm_confidence_factors)._asdict()
+        )
+        
+        # Lazy %-formatting: nothing is built unless DEBUG is enabled
+        logger.debug(
+            "Confidence for '%s': %s", diagnosis.get('diagnosis'), confidence_score.overall_confidence
+        )
+        
+        return confidence_score
+    
+    def _compute_confidence_values(
+        self,
+        diagnosis: Dict,
+        evidence_chunks: List[Dict],
+        llm_confidence_factors: Dict = None
+    ) -> _ConfidenceValues:
+        """
+        compute_confidence_score without the pydantic model.
+        
+        For internal stages (e.g. sorting by confidence) that do not need a
+        validated ConfidenceScore; promote at the API boundary.
+        """
         # Extract LLM confidence factors if available
         llm_factors = llm_confidence_factors or diagnosis.get("confidence_factors", {})
         
@@ -238,7 +415,7 @@ class ValidationService:
             ) / len(supporting_evidence)
         else:
             # No external evidence - assign low baseline score
-            evidence_strength = 0.3
+            evidence_strength = _BASELINE_EVIDENCE_STRENGTH
         
         # Citation count
         citation_count = len(evidence_refs)
@@ -250,26 +427,115 @@ class ValidationService:
         # When evidence is missing, reasoning consistency becomes more important
         if citation_count > 0:
             overall_confidence = (
-                evidence_strength * 0.5 +
-                reasoning_consistency * 0.3 +
-                min(citation_count / 5.0, 1.0) * 0.2  # Normalize citation count
+                evidence_strength * _EVIDENCE_WEIGHT +
+                reasoning_consistency * _REASONING_WEIGHT +
+                min(citation_count / _CITATION_SATURATION, 1.0) * _CITATION_WEIGHT  # Normalize citation count
             )
         else:
             # No external evidence - confidence based on clinical reasoning only
-            overall_confidence = reasoning_consistency * 0.6
+            overall_confidence = reasoning_consistency * _REASONING_ONLY_WEIGHT
         
-        confidence_score = ConfidenceScore(
+        return _ConfidenceValues(
             overall_confidence=round(overall_confidence, 3),
             evidence_strength=round(evidence_strength, 3),
             reasoning_consistency=round(reasoning_consistency, 3),
             citation_count=citation_count
         )
+    
+    def compute_confidence_scores_batch(
+        self,
+        diagnoses: List[Dict],
+        evidence_chunks: List[Dict],
+        llm_confidence_factors: Dict = None
+    ) -> List[ConfidenceScore]:
+        """
+        Compute confidence scores for many diagnoses at once.
         
-        logger.debug(
-            f"Confidence for '{diagnosis.get('diagnosis')}': {confidence_score.overall_confidence}"
+        Same scoring as compute_confidence_score, but the arithmetic runs as
+        NumPy array operations over all diagnoses: cited similarities are
+        gathered once and summed per diagnosis with np.bincount.
+        
+        Args:
+            diagnoses: Differential diagnoses
+            evidence_chunks: Evidence chunks shared by the diagnoses (may be empty)
+            llm_confidence_factors: Confidence factors from LLM (applied to all)
+        
+        Returns:
+            ConfidenceScore objects, in diagnosis order
+        """
+        return [
+            ConfidenceScore(**values._asdict())
+            for values in self._compute_confidence_values_batch(
+                diagnoses, evidence_chunks, llm_confidence_factors
+            )
+        ]
+    
+    def _compute_confidence_values_batch(
+        self,
+        diagnoses: List[Dict],
+        evidence_chunks: List[Dict],
+        llm_confidence_factors: Dict = None
+    ) -> List[_ConfidenceValues]:
+        """compute_confidence_scores_batch without the pydantic models."""
+        if not diagnoses:
+            return []
+        
+        similarities = np.array(
+            [e.get("similarity_score", 0) for e in evidence_chunks], dtype=np.float64
         )
         
-        return confidence_score
+        # Flatten valid 1-based evidence references; owners maps each back to its diagnosis
+        ref_indices = []
+        owners = []
+        citation_counts = []
+        consistencies = []
+        for i, diagnosis in enumerate(diagnoses):
+            llm_factors = llm_confidence_factors or diagnosis.get("confidence_factors", {})
+            evidence_refs = diagnosis.get("evidence_references", [])
+            for ref in evidence_refs:
+                if isinstance(ref, int) and 0 <= ref - 1 < len(evidence_chunks):
+                    ref_indices.append(ref - 1)
+                    owners.append(i)
+            citation_counts.append(len(evidence_refs))
+            consistencies.append(llm_factors.get("reasoning_consistency", 0.70))
+        
+        n = len(diagnoses)
+        owners = np.array(owners, dtype=np.intp)
+        support_counts = np.bincount(owners, minlength=n)
+        support_sums = np.bincount(
+            owners, weights=similarities[np.array(ref_indices, dtype=np.intp)], minlength=n
+        )
+        citation_counts = np.array(citation_counts, dtype=np.int64)
+        reasoning_consistency = np.array(consistencies, dtype=np.float64)
+        
+        # No external evidence - assign low baseline score
+        evidence_strength = np.where(
+            support_counts > 0, support_sums / np.maximum(support_counts, 1), _BASELINE_EVIDENCE_STRENGTH
+        )
+        
+        # Without citations, confidence is based on clinical reasoning only
+        overall_confidence = np.where(
+            citation_counts > 0,
+            evidence_strength * _EVIDENCE_WEIGHT +
+            reasoning_consistency * _REASONING_WEIGHT +
+            np.minimum(citation_counts / _CITATION_SATURATION, 1.0) * _CITATION_WEIGHT,
+            reasoning_consistency * _REASONING_ONLY_WEIGHT
+        )
+        
+        return [
+            _ConfidenceValues(
+                overall_confidence=round(overall, 3),
+                evidence_strength=round(strength, 3),
+                reasoning_consistency=round(consistency, 3),
+                citation_count=count
+            )
+            for overall, strength, consistency, count in zip(
+                overall_confidence.tolist(),
+                evidence_strength.tolist(),
+                reasoning_consistency.tolist(),
+                citation_counts.tolist()
+            )
+        ]
     
     def should_return_insufficient_data(
         self,
@@ -383,9 +649,9 @@ class ValidationService:
         validation_results["warnings"] = all_warnings
         
         logger.info(
-            f"Validation complete: "
-            f"should_fail={should_fail}, "
-            f"warnings={len(all_warnings)}"
+            "Validation complete: should_fail=%s, warnings=%d",
+            should_fail,
+            len(all_warnings)
         )
         
         return validation_results
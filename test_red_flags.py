@@ -3,6 +3,17 @@ Quick test script to check if red_flags are being generated
 """
 import requests
 import json
+from utils.clinical_intelligence import identify_red_flags
+
+# Local check: symptom-combination flag must survive inflected phrasing
+print("=" * 80)
+print("LOCAL CHECK: CHEST PAIN + DIAPHORESIS COMBINATION")
+print("=" * 80)
+for symptom_names in (["chest pain", "diaphoresis"], ["chest pains", "sweating"], ["severe chest painful", "profuse sweating"]):
+    local_flags = identify_red_flags([], {"symptom_names": symptom_names})
+    found = any("CHEST PAIN + DIAPHORESIS" in flag for flag in local_flags)
+    print(f"{'✅' if found else '❌'} {symptom_names}: {'flagged' if found else 'NOT FLAGGED'}")
+print()
 
 # Test case guaranteed to trigger red flags
 test_data = {
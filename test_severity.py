@@ -3,7 +3,9 @@ Test Symptom Severity Calculator
 Quick verification that severity calculation works correctly
 """
 
-from services.severity_calculator import severity_calculator
+from services.severity_calculator import get_severity_calculator
+
+severity_calculator = get_severity_calculator()
 
 # Test cases
 test_symptoms = [
@@ -67,6 +69,30 @@ for symptom in test_symptoms:
     print(f"  Calculated Severity: {severity}/10")
     print()
 
+print("=" * 80)
+print("SYMPTOM RULE ROUTING")
+print("=" * 80)
+print()
+
+# Rules match the longest known symptom phrase on whole words; anything
+# without a known phrase falls back to keyword-based severity (None)
+routing_cases = [
+    ("chest pain", severity_calculator._calculate_chest_pain_severity),
+    ("severe chest pain", severity_calculator._calculate_chest_pain_severity),
+    ("acute shortness of breath", severity_calculator._calculate_respiratory_severity),
+    ("fever vomiting", severity_calculator._calculate_fever_severity),
+    ("coughing", None),
+    ("chest tightness", None),
+]
+
+for base_symptom, expected_rule in routing_cases:
+    rule = severity_calculator._match_symptom_rule(base_symptom)
+    expected_name = expected_rule.__name__ if expected_rule else "keyword fallback"
+    actual_name = rule.__name__ if rule else "keyword fallback"
+    status = "✅" if rule == expected_rule else "❌"
+    print(f"{status} '{base_symptom}' -> {actual_name} (expected {expected_name})")
+
+print()
 print("=" * 80)
 print("✅ Test complete!")
 print()
@@ -3,9 +3,272 @@ Clinical Intelligence Helper Functions
 Generates actionable recommendations, alerts, and management plans.
 """
 
-from typing import List, Dict
+import logging
+import operator
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
 
-def get_recommended_tests(diagnosis: str) -> List[str]:
+try:
+    import ahocorasick  # Optional: one-pass diagnosis keyword dispatch
+except ImportError:
+    ahocorasick = None
+
+# Diagnosis buckets and their (uppercase, substring) keywords; earlier buckets win
+_DIAGNOSIS_BUCKETS = (
+    ("acs", ("ACUTE CORONARY", "MYOCARDIAL INFARCTION", "ACS", "AMI")),
+    ("aortic_dissection", ("AORTIC DISSECTION",)),
+    ("pneumonia", ("PNEUMONIA", "CAP")),
+    ("pulmonary_embolism", ("PULMONARY EMBOLISM",)),  # Also the exact name "PE"
+    ("bronchitis", ("BRONCHITIS",)),
+    ("gerd", ("GERD",)),
+    ("esophageal", ("ESOPHAGEAL",)),
+    ("heart_failure", ("HEART FAILURE", "CHF")),
+)
+_BUCKET_PRIORITY = {bucket: i for i, (bucket, _) in enumerate(_DIAGNOSIS_BUCKETS)}
+
+_TESTS_BY_BUCKET = {
+    # Cardiovascular
+    "acs": (
+        "12-lead ECG (STAT)",
+        "Troponin I or T (serial measurements)",
+        "CK-MB",
+        "Complete metabolic panel",
+        "Lipid panel"
+    ),
+    "aortic_dissection": (
+        "CT angiography chest (STAT)",
+        "Transthoracic echocardiography",
+        "Blood pressure measurement (all extremities)",
+        "D-dimer"
+    ),
+    # Respiratory
+    "pneumonia": (
+        "Chest X-ray (PA and lateral)",
+        "CBC with differential",
+        "Blood cultures (if febrile)",
+        "Sputum culture and gram stain",
+        "Arterial blood gas (if hypoxemic)"
+    ),
+    "pulmonary_embolism": (
+        "D-dimer (if low/intermediate risk)",
+        " CT pulmonary angiography",
+        "Venous duplex ultrasound (lower extremities)",
+        "ECG",
+        "Arterial blood gas"
+    ),
+    "bronchitis": (
+        "Chest X-ray (if severe or prolonged)",
+        "Pulse oximetry",
+        "Sputum culture (if purulent)"
+    ),
+    # Gastrointestinal
+    "gerd": (
+        "Trial of PPI therapy",
+        "Upper endoscopy (if alarm symptoms)",
+        "Esophageal manometry (if refractory)",
+        "24-hour pH monitoring"
+    ),
+    # Cardiac (non-ACS)
+    "heart_failure": (
+        "BNP or NT-proBNP",
+        "Echocardiography",
+        "ECG",
+        "Chest X-ray",
+        "Complete metabolic panel"
+    ),
+}
+_TESTS_BY_BUCKET["esophageal"] = _TESTS_BY_BUCKET["gerd"]
+
+_DEFAULT_TESTS = (
+    "Complete blood count (CBC)",
+    "Comprehensive metabolic panel",
+    "Relevant imaging based on clinical presentation"
+)
+
+# Management when the risk level is not Red (or does not matter)
+_MANAGEMENT_BY_BUCKET = {
+    # High-risk cardiac
+    "acs": (
+        "Aspirin 325mg PO",
+        "Serial troponins",
+        "Cardiology consultation",
+        "Continuous monitoring"
+    ),
+    "aortic_dissection": (
+        "IV beta-blocker (labetolol) for BP control (target SBP 100-120)",
+        "IV access (2 large-bore)",
+        "Type and cross match blood",
+        "Emergent CT surgery consultation",
+        "NPO status",
+        "Pain control"
+    ),
+    # Respiratory
+    "pneumonia": (
+        "Oxygen therapy if SpO2 < 90%",
+        "Empiric antibiotics (e.g., Ceftriaxone 1g IV + Azithromycin 500mg PO)",
+        "IV fluid resuscitation if dehydrated",
+        "Antipyretics for fever",
+        "Reassess clinical status in 48-72h"
+    ),
+    "pulmonary_embolism": (
+        "Anticoagulation (LMWH or DOAC)",
+        "Oxygen if hypoxemic",
+        "Pain control",
+        "Outpatient vs inpatient based on PESI score"
+    ),
+    "bronchitis": (
+        "Symptomatic treatment (cough suppressants, expectorants)",
+        "Bronchodilators if wheezing",
+        "Hydration",
+        "Avoid antibiotics unless bacterial superinfection suspected"
+    ),
+    # GI
+    "gerd": (
+        "PPI therapy (e.g., omeprazole 20mg daily)",
+        "Lifestyle modifications (elevate head of bed, avoid triggers)",
+        "Antacids PRN",
+        "Avoid late-night meals"
+    ),
+}
+
+# Management overrides for a Red risk level
+_RED_RISK_MANAGEMENT = {
+    "acs": (
+        "Aspirin 325mg PO (chewed) immediately",
+        "Sublingual nitroglycerin",
+        "Oxygen if SpO2 < 94%",
+        "IV access",
+        "Continuous cardiac monitoring",
+        "Activate cath lab (if STEMI)",
+        "Heparin or LMWH anticoagulation"
+    ),
+    "pulmonary_embolism": (
+        "Oxygen supplementation",
+        "Anticoagulation (heparin bolus + infusion)",
+        "Hemodynamic monitoring",
+        "Consider thrombolytics if massive PE",
+        "ICU admission consideration"
+    ),
+}
+
+_DEFAULT_MANAGEMENT = (
+    "Supportive care",
+    "Symptomatic treatment",
+    "Monitor clinical status",
+    "Specialist consultation if indicated"
+)
+
+# High-risk diagnosis alerts: (uppercase name keywords, alert, log label); first match wins
+_DIAGNOSIS_RED_FLAG_RULES = (
+    (("ACUTE CORONARY", "MYOCARDIAL"),
+     "🚨 CRITICAL: Possible ACS/MI - Immediate ECG and cardiac biomarkers required", "Cardiac"),
+    (("AORTIC DISSECTION",),
+     "🚨 LIFE-THREATENING: Possible aortic dissection - STAT CT angiography, BP control", "Aortic dissection"),
+    (("PULMONARY EMBOLISM",),
+     "🚨 HIGH RISK: Possible PE - Consider immediate anticoagulation pending imaging", "PE"),
+)
+
+# Vital sign alerts: (vitals keys in lookup order, comparison, threshold, alert)
+_VITAL_RED_FLAG_RULES = (
+    (("SpO2", "oxygen_saturation"), operator.lt, 90,
+     "🚨 HYPOXEMIA: SpO2 < 90% - Immediate oxygen supplementation required"),
+    (("HR", "heart_rate"), operator.gt, 120,
+     "⚠️  TACHYCARDIA: Heart rate > 120 - Assess for shock, sepsis, or cardiac arrhythmia"),
+    (("SBP", "systolic_bp"), operator.lt, 90,
+     "🚨 HYPOTENSION: SBP < 90 - Assess for shock, consider IV fluids"),
+)
+
+
+def _has_min_items(n: int):
+    """Completeness check: at least n entries."""
+    return lambda value: len(value) >= n
+
+
+def _timeline_is_known(timeline: str) -> bool:
+    """Completeness check: a timeline that is not marked unknown."""
+    return "unknown" not in timeline.lower()
+
+
+# Missing-information checklist, in output order:
+# (keys in lookup order, completeness check or None, alert, required sub-keys)
+# The first truthy key's value is checked; if it passes, each
+# (alternative keys, alert) entry it lacks adds that alert.
+_MISSING_INFO_CHECKS = (
+    (("vitals",), _has_min_items(3),
+     "Complete vital signs (BP, HR, RR, Temp, SpO2) - Critical for risk stratification",
+     ((("SpO2", "oxygen_saturation"), "Oxygen saturation (SpO2) - Important for respiratory assessment"),
+      (("BP", "blood_pressure"), "Blood pressure - Critical for hemodynamic assessment"))),
+    (("labs",), None,
+     "Laboratory values (CBC, metabolic panel, cardiac biomarkers) - Would help confirm/rule out diagnoses", ()),
+    (("physical_exam", "physical_exam_findings"), _has_min_items(2),
+     "Detailed physical examination findings - Essential for clinical assessment", ()),
+    (("timeline",), _timeline_is_known,
+     "Precise symptom onset and progression timeline - Helps differentiate acute vs chronic conditions", ()),
+    (("past_medical_history", "medical_history"), None,
+     "Past medical history - Risk factors would inform probability estimates", ()),
+    (("medications",), None,
+     "Current medications - Important for drug interactions and underlying conditions", ()),
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _build_diagnosis_automaton():
+    """
+    Aho-Corasick automaton over every bucket keyword: keyword → bucket.
+    
+    Returns None when pyahocorasick is not installed.
+    """
+    if ahocorasick is None:
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for bucket, keywords in _DIAGNOSIS_BUCKETS:
+        for keyword in keywords:
+            automaton.add_word(keyword, bucket)
+    automaton.make_automaton()
+    return automaton
+
+
+_DIAGNOSIS_AUTOMATON = _build_diagnosis_automaton()
+
+
+@lru_cache(maxsize=4096)
+def _diagnosis_buckets(diagnosis: str) -> Tuple[str, ...]:
+    """
+    Buckets whose keywords occur in the diagnosis, highest priority first.
+    
+    Memoized: the same names recur across requests, and both getters for a
+    diagnosis share one uppercase + keyword scan.
+    """
+    dx_upper = diagnosis.upper()
+    
+    # One pass finds every keyword
+    if _DIAGNOSIS_AUTOMATON is not None:
+        buckets = {bucket for _, bucket in _DIAGNOSIS_AUTOMATON.iter(dx_upper)}
+    else:
+        buckets = {
+            bucket for bucket, keywords in _DIAGNOSIS_BUCKETS
+            if any(keyword in dx_upper for keyword in keywords)
+        }
+    if dx_upper == "PE":
+        buckets.add("pulmonary_embolism")
+    
+    return tuple(sorted(buckets, key=_BUCKET_PRIORITY.__getitem__))
+
+
+@lru_cache(maxsize=64)
+def _is_red_risk(risk_level: str) -> bool:
+    """Whether a risk level label is the red/danger tier (memoized: a handful of labels)."""
+    return "RED" in risk_level.upper()
+
+
+def _match_bucket(diagnosis: str, table: Dict) -> Optional[str]:
+    """Highest-priority bucket in table whose keywords occur in the diagnosis."""
+    return next((bucket for bucket in _diagnosis_buckets(diagnosis) if bucket in table), None)
+
+
+def get_recommended_tests(diagnosis: str) -> Tuple[str, ...]:
     """
     Get recommended diagnostic tests for a specific diagnosis.
     
@@ -13,83 +276,13 @@ def get_recommended_tests(diagnosis: str) -> List[str]:
         diagnosis: Name of the diagnosis
         
     Returns:
-        List of recommended tests
+        Recommended tests (shared module constant; copy before mutating)
     """
-    dx_upper = diagnosis.upper()
-    
-    # Cardiovascular
-    if any(term in dx_upper for term in ["ACUTE CORONARY", "MYOCARDIAL INFARCTION", "ACS", "AMI"]):
-        return [
-            "12-lead ECG (STAT)",
-            "Troponin I or T (serial measurements)",
-            "CK-MB",
-            "Complete metabolic panel",
-            "Lipid panel"
-        ]
-    
-    elif "AORTIC DISSECTION" in dx_upper:
-        return [
-            "CT angiography chest (STAT)",
-            "Transthoracic echocardiography",
-            "Blood pressure measurement (all extremities)",
-            "D-dimer"
-        ]
-    
-    # Respiratory
-    elif "PNEUMONIA" in dx_upper or "CAP" in dx_upper:
-        return [
-            "Chest X-ray (PA and lateral)",
-            "CBC with differential",
-            "Blood cultures (if febrile)",
-            "Sputum culture and gram stain",
-            "Arterial blood gas (if hypoxemic)"
-        ]
-    
-    elif "PULMONARY EMBOLISM" in dx_upper or dx_upper == "PE":
-        return [
-            "D-dimer (if low/intermediate risk)",
-            " CT pulmonary angiography",
-            "Venous duplex ultrasound (lower extremities)",
-            "ECG",
-            "Arterial blood gas"
-        ]
-    
-    elif "BRONCHITIS" in dx_upper:
-        return [
-            "Chest X-ray (if severe or prolonged)",
-            "Pulse oximetry",
-            "Sputum culture (if purulent)"
-        ]
-    
-    # Gastrointestinal
-    elif "GERD" in dx_upper or "ESOPHAGEAL" in dx_upper:
-        return [
-            "Trial of PPI therapy",
-            "Upper endoscopy (if alarm symptoms)",
-            "Esophageal manometry (if refractory)",
-            "24-hour pH monitoring"
-        ]
-    
-    # Cardiac (non-ACS)
-    elif "HEART FAILURE" in dx_upper or "CHF" in dx_upper:
-        return [
-            "BNP or NT-proBNP",
-            "Echocardiography",
-            "ECG",
-            "Chest X-ray",
-            "Complete metabolic panel"
-        ]
-    
-    # Default
-    else:
-        return [
-            "Complete blood count (CBC)",
-            "Comprehensive metabolic panel",
-            "Relevant imaging based on clinical presentation"
-        ]
+    bucket = _match_bucket(diagnosis, _TESTS_BY_BUCKET)
+    return _TESTS_BY_BUCKET.get(bucket, _DEFAULT_TESTS)
 
 
-def get_initial_management(diagnosis: str, risk_level: str) -> List[str]:
+def get_initial_management(diagnosis: str, risk_level: str) -> Tuple[str, ...]:
     """
     Get initial management recommendations for a diagnosis.
     
@@ -98,92 +291,14 @@ def get_initial_management(diagnosis: str, risk_level: str) -> List[str]:
         risk_level: Red/Danger, Orange/Warning, or Blue/Low
         
     Returns:
-        List of initial management steps
+        Initial management steps (shared module constant; copy before mutating)
     """
-    dx_upper = diagnosis.upper()
+    bucket = _match_bucket(diagnosis, _MANAGEMENT_BY_BUCKET)
     
-    # High-risk cardiac
-    if any(term in dx_upper for term in ["ACUTE CORONARY", "MYOCARDIAL INFARCTION", "ACS", "AMI"]):
-        if "RED" in risk_level.upper():
-            return [
-                "Aspirin 325mg PO (chewed) immediately",
-                "Sublingual nitroglycerin",
-                "Oxygen if SpO2 < 94%",
-                "IV access",
-                "Continuous cardiac monitoring",
-                "Activate cath lab (if STEMI)",
-                "Heparin or LMWH anticoagulation"
-            ]
-        else:
-            return [
-                "Aspirin 325mg PO",
-                "Serial troponins",
-                "Cardiology consultation",
-                "Continuous monitoring"
-            ]
+    if bucket in _RED_RISK_MANAGEMENT and _is_red_risk(risk_level):
+        return _RED_RISK_MANAGEMENT[bucket]
     
-    elif "AORTIC DISSECTION" in dx_upper:
-        return [
-            "IV beta-blocker (labetolol) for BP control (target SBP 100-120)",
-            "IV access (2 large-bore)",
-            "Type and cross match blood",
-            "Emergent CT surgery consultation",
-            "NPO status",
-            "Pain control"
-        ]
-    
-    # Respiratory
-    elif "PNEUMONIA" in dx_upper or "CAP" in dx_upper:
-        return [
-            "Oxygen therapy if SpO2 < 90%",
-            "Empiric antibiotics (e.g., Ceftriaxone 1g IV + Azithromycin 500mg PO)",
-            "IV fluid resuscitation if dehydrated",
-            "Antipyretics for fever",
-            "Reassess clinical status in 48-72h"
-        ]
-    
-    elif "PULMONARY EMBOLISM" in dx_upper or dx_upper == "PE":
-        if "RED" in risk_level.upper():
-            return [
-                "Oxygen supplementation",
-                "Anticoagulation (heparin bolus + infusion)",
-                "Hemodynamic monitoring",
-                "Consider thrombolytics if massive PE",
-                "ICU admission consideration"
-            ]
-        else:
-            return [
-                "Anticoagulation (LMWH or DOAC)",
-                "Oxygen if hypoxemic",
-                "Pain control",
-                "Outpatient vs inpatient based on PESI score"
-            ]
-    
-    elif "BRONCHITIS" in dx_upper:
-        return [
-            "Symptomatic treatment (cough suppressants, expectorants)",
-            "Bronchodilators if wheezing",
-            "Hydration",
-            "Avoid antibiotics unless bacterial superinfection suspected"
-        ]
-    
-    # GI
-    elif "GERD" in dx_upper:
-        return [
-            "PPI therapy (e.g., omeprazole 20mg daily)",
-            "Lifestyle modifications (elevate head of bed, avoid triggers)",
-            "Antacids PRN",
-            "Avoid late-night meals"
-        ]
-    
-    # Default
-    else:
-        return [
-            "Supportive care",
-            "Symptomatic treatment",
-            "Monitor clinical status",
-            "Specialist consultation if indicated"
-        ]
+    return _MANAGEMENT_BY_BUCKET.get(bucket, _DEFAULT_MANAGEMENT)
 
 
 def identify_red_flags(diagnoses: List[Dict], normalized_data: Dict) -> List[str]:
@@ -192,7 +307,7 @@ def identify_red_flags(diagnoses: List[Dict], normalized_data: Dict) -> List[str
     
     Args:
         diagnoses: List of differential diagnoses with confidence and risk
-        normalized_data: Normalized patient data
+        normalized_data: Normalized patient data (with string "symptom_names")
         
     Returns:
         List of red flag alerts
@@ -200,8 +315,6 @@ def identify_red_flags(diagnoses: List[Dict], normalized_data: Dict) -> List[str
     flags = []
     
     # 🔍 DEBUG: Log what we're checking
-    import logging
-    logger = logging.getLogger(__name__)
     logger.info("=" * 80)
     logger.info("🔍 RED FLAGS DETECTION")
     logger.info("=" * 80)
@@ -219,39 +332,26 @@ def identify_red_flags(diagnoses: List[Dict], normalized_data: Dict) -> List[str
         
         if "RED" in risk_level and confidence > 0.55:
             logger.info(f"    ✅ HIGH RISK + HIGH CONFIDENCE - Checking for specific conditions...")
-            if "ACUTE CORONARY" in dx_name or "MYOCARDIAL" in dx_name:
-                flags.append("🚨 CRITICAL: Possible ACS/MI - Immediate ECG and cardiac biomarkers required")
-                logger.info(f"    🚨 RED FLAG ADDED: Cardiac")
-            elif "AORTIC DISSECTION" in dx_name:
-                flags.append("🚨 LIFE-THREATENING: Possible aortic dissection - STAT CT angiography, BP control")
-                logger.info(f"    🚨 RED FLAG ADDED: Aortic dissection")
-            elif "PULMONARY EMBOLISM" in dx_name:
-                flags.append("🚨 HIGH RISK: Possible PE - Consider immediate anticoagulation pending imaging")
-                logger.info(f"    🚨 RED FLAG ADDED: PE")
+            for keywords, alert, label in _DIAGNOSIS_RED_FLAG_RULES:
+                if any(keyword in dx_name for keyword in keywords):
+                    flags.append(alert)
+                    logger.info(f"    🚨 RED FLAG ADDED: {label}")
+                    break
         else:
             logger.info(f"    ⏭️  Skipped (risk={risk_level}, conf={confidence:.2f})")
     
-    # Check vital signs
+    # Check vital signs (first truthy value among each rule's keys)
     vitals = normalized_data.get("vitals", {})
     if vitals:
-        spo2 = vitals.get("SpO2") or vitals.get("oxygen_saturation")
-        if spo2 and spo2 < 90:
-            flags.append("🚨 HYPOXEMIA: SpO2 < 90% - Immediate oxygen supplementation required")
-        
-        hr = vitals.get("HR") or vitals.get("heart_rate")
-        if hr and hr > 120:
-            flags.append("⚠️  TACHYCARDIA: Heart rate > 120 - Assess for shock, sepsis, or cardiac arrhythmia")
-        
-        sbp = vitals.get("SBP") or vitals.get("systolic_bp")
-        if sbp and sbp < 90:
-            flags.append("🚨 HYPOTENSION: SBP < 90 - Assess for shock, consider IV fluids")
+        for keys, breaches, threshold, alert in _VITAL_RED_FLAG_RULES:
+            value = next((vitals[key] for key in keys if vitals.get(key)), None)
+            if value and breaches(value, threshold):
+                flags.append(alert)
     
     # Check for concerning symptom combinations
-    symptoms = normalized_data.get("symptom_names", normalized_data.get("symptoms", []))
-    # Ensure symptoms are strings
-    if symptoms and isinstance(symptoms[0], dict):
-        symptoms = [s.get("symptom", "") for s in symptoms]
-    symptoms_str = " ".join([s.lower() for s in symptoms if isinstance(s, str)])
+    # symptom_names is List[str], filled once by the pipeline's normalization step
+    # Substring search keeps inflected phrases ("chest pains") flagged
+    symptoms_str = " ".join(s.lower() for s in normalized_data.get("symptom_names", []))
     
     if "chest pain" in symptoms_str and ("diaphoresis" in symptoms_str or "sweating" in symptoms_str):
         if not any("CARDIAC" in flag or "ACS" in flag for flag in flags):
@@ -282,39 +382,13 @@ def identify_missing_information(normalized_data: Dict) -> List[str]:
     """
     missing = []
     
-    # Vital signs
-    vitals = normalized_data.get("vitals", {})
-    if not vitals or len(vitals) < 3:
-        missing.append("Complete vital signs (BP, HR, RR, Temp, SpO2) - Critical for risk stratification")
-    else:
-        if "SpO2" not in vitals and "oxygen_saturation" not in vitals:
-            missing.append("Oxygen saturation (SpO2) - Important for respiratory assessment")
-        if "BP" not in vitals and "blood_pressure" not in vitals:
-            missing.append("Blood pressure - Critical for hemodynamic assessment")
-    
-    # Labs
-    labs = normalized_data.get("labs", {})
-    if not labs or len(labs) == 0:
-        missing.append("Laboratory values (CBC, metabolic panel, cardiac biomarkers) - Would help confirm/rule out diagnoses")
-    
-    # Physical exam
-    phys_exam = normalized_data.get("physical_exam", []) or normalized_data.get("physical_exam_findings", [])
-    if not phys_exam or len(phys_exam) < 2:
-        missing.append("Detailed physical examination findings - Essential for clinical assessment")
-    
-    # Timeline
-    timeline = normalized_data.get("timeline")
-    if not timeline or "unknown" in timeline.lower():
-        missing.append("Precise symptom onset and progression timeline - Helps differentiate acute vs chronic conditions")
-    
-    # Medical history
-    pmhx = normalized_data.get("past_medical_history", []) or normalized_data.get("medical_history", [])
-    if not pmhx:
-        missing.append("Past medical history - Risk factors would inform probability estimates")
-    
-    # Medications
-    meds = normalized_data.get("medications", [])
-    if not meds:
-        missing.append("Current medications - Important for drug interactions and underlying conditions")
+    for keys, is_complete, alert, required in _MISSING_INFO_CHECKS:
+        value = next((normalized_data[key] for key in keys if normalized_data.get(key)), None)
+        if not value or (is_complete is not None and not is_complete(value)):
+            missing.append(alert)
+            continue
+        for alternatives, sub_alert in required:
+            if not any(key in value for key in alternatives):
+                missing.append(sub_alert)
     
     return missing
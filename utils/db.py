@@ -10,8 +10,14 @@ CRITICAL RULES:
 """
 
 from supabase import create_client, Client
-from typing import List, Dict, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import List, Dict, Optional, Tuple, Union
+import json
 import logging
+import threading
+import time
 from config.settings import settings
 import numpy as np
 
@@ -30,9 +36,18 @@ class SupabaseVectorStore:
     # Table and schema constants
     TABLE_NAME = "statpearls_embeddings"
     EMBEDDING_DIM = 768  # Model embedding dimension
+    HALFVEC_CANDIDATES = 40  # Min halfvec HNSW candidates re-ranked at fp32 (= default hnsw.ef_search)
+    SEARCH_WORKERS = 8  # Concurrent RPCs in similarity_search_many
+    CHUNK_CACHE_SIZE = 1024  # Rows kept by get_chunk_by_id / get_chunks_by_ids
+    CHUNK_CACHE_TTL_SECONDS = 600.0
     
     def __init__(self):
-        """Initialize Supabase client."""
+        """
+        Initialize Supabase client.
+        
+        The service-role admin client is created on first use, since request
+        paths only search.
+        """
         logger.info("Initializing Supabase client")
         
         self.client: Client = create_client(
@@ -40,13 +55,20 @@ class SupabaseVectorStore:
             settings.SUPABASE_KEY
         )
         
-        # Use service role key for admin operations (indexing)
-        self.admin_client: Client = create_client(
+        self._search_executor = None  # Persistent RPC workers, created on first multi-query search
+        # LRU of chunk rows by chunk_id: (expiry on the monotonic clock, row)
+        self._chunk_cache = OrderedDict()
+        self._chunk_cache_lock = threading.Lock()
+        
+        logger.info("Supabase client initialized successfully")
+    
+    @cached_property
+    def admin_client(self) -> Client:
+        """Service-role client for admin operations (indexing), created on first access."""
+        return create_client(
             settings.SUPABASE_URL,
             settings.SUPABASE_SERVICE_ROLE_KEY
         )
-        
-        logger.info("Supabase client initialized successfully")
     
     def create_table_if_not_exists(self):
         """
@@ -82,10 +104,14 @@ class SupabaseVectorStore:
             created_at TIMESTAMP DEFAULT NOW()
         );
         
-        -- Create HNSW index for fast similarity search
+        -- Create HNSW index for fast similarity search over a half-precision
+        -- expression (pgvector 0.7+): half the bytes per graph probe, while
+        -- the fp32 column stays available for exact re-ranking.
+        -- Embeddings are stored L2-normalized, so inner product equals cosine
+        -- similarity without per-comparison norms
         CREATE INDEX IF NOT EXISTS statpearls_embeddings_hnsw_idx
         ON {self.TABLE_NAME}
-        USING hnsw (embedding vector_cosine_ops)
+        USING hnsw ((embedding::halfvec({self.EMBEDDING_DIM})) halfvec_ip_ops)
         WITH (m = 16, ef_construction = 64);
         
         -- Create index on section_type for faster filtering
@@ -104,7 +130,7 @@ class SupabaseVectorStore:
     
     def insert_embeddings_batch(
         self,
-        embeddings: List[List[float]],
+        embeddings: Union[np.ndarray, List[List[float]]],
         texts: List[str],
         metadata_list: List[Dict[str, str]],
         batch_size: int = 100
@@ -114,8 +140,12 @@ class SupabaseVectorStore:
         
         CRITICAL: Uses psycopg2 directly to avoid JSON encoding issues.
         
+        All batches run in one transaction with synchronous_commit off, so
+        the load pays for a single commit. The upsert is idempotent, so a
+        failed run is simply re-run.
+        
         Args:
-            embeddings: List of embedding vectors
+            embeddings: (N, dim) array from embed_documents, or a list of vectors
             texts: List of chunk texts
             metadata_list: List of metadata dicts (title, section_type, etc.)
             batch_size: Batch size for inserts
@@ -128,6 +158,7 @@ class SupabaseVectorStore:
         
         # Import psycopg2 for raw SQL
         import psycopg2
+        from psycopg2.extras import execute_values
         import os
         
         total_inserted = 0
@@ -140,41 +171,46 @@ class SupabaseVectorStore:
         cur = conn.cursor()
         
         try:
+            # Bulk load: don't wait for the WAL flush at commit (re-runnable)
+            cur.execute("SET LOCAL synchronous_commit = off")
+            
             # Process in batches
             for i in range(0, len(embeddings), batch_size):
                 batch_embeddings = embeddings[i:i + batch_size]
                 batch_texts = texts[i:i + batch_size]
                 batch_metadata = metadata_list[i:i + batch_size]
                 
-                # Use INSERT with ON CONFLICT for upsert
-                for emb, text, meta in zip(batch_embeddings, batch_texts, batch_metadata):
-                    # Convert embedding list to PostgreSQL array literal string
-                    emb_str = '[' + ','.join(str(x) for x in emb) + ']'
-                    
-                    # Use parameterized query with VECTOR casting
-                    cur.execute("""
-                        INSERT INTO statpearls_embeddings (embedding, content, title, chunk_id, section_type, source)
-                        VALUES (%s::vector, %s, %s, %s, %s, %s)
-                        ON CONFLICT (chunk_id) DO UPDATE SET
-                            embedding = EXCLUDED.embedding,
-                            content = EXCLUDED.content,
-                            title = EXCLUDED.title,
-                            section_type = EXCLUDED.section_type,
-                            source = EXCLUDED.source
-                    """, (
-                        emb_str,
+                # Keyed by chunk_id: one statement cannot upsert the same row
+                # twice, so the last duplicate wins as with row-by-row inserts
+                rows = {
+                    meta.get("chunk_id"): (
+                        vector_literal(emb),
                         text,
                         meta.get("title"),
                         meta.get("chunk_id"),
                         meta.get("section_type"),
                         meta.get("source", "statpearls")
-                    ))
-                    total_inserted += 1
-               
-                # Commit after each batch
-                conn.commit()
-                logger.info(f"Inserted batch {i // batch_size + 1}: {len(batch_embeddings)} records")
+                    )
+                    for emb, text, meta in zip(batch_embeddings, batch_texts, batch_metadata)
+                }
                 
+                # One multi-row INSERT with ON CONFLICT upsert per batch
+                execute_values(cur, """
+                    INSERT INTO statpearls_embeddings (embedding, content, title, chunk_id, section_type, source)
+                    VALUES %s
+                    ON CONFLICT (chunk_id) DO UPDATE SET
+                        embedding = EXCLUDED.embedding,
+                        content = EXCLUDED.content,
+                        title = EXCLUDED.title,
+                        section_type = EXCLUDED.section_type,
+                        source = EXCLUDED.source
+                """, list(rows.values()), template="(%s::vector, %s, %s, %s, %s, %s)", page_size=len(rows))
+                total_inserted += len(batch_embeddings)
+                logger.info(f"Inserted batch {i // batch_size + 1}: {len(batch_embeddings)} records")
+            
+            # Single commit for the whole load
+            conn.commit()
+            
         except Exception as e:
             logger.error(f"Error inserting batch: {e}")
             conn.rollback()
@@ -188,17 +224,19 @@ class SupabaseVectorStore:
     
     def similarity_search(
         self,
-        query_embedding: List[float],
+        query_embedding: Union[np.ndarray, List[float]],
         top_k: int = None,
-        threshold: float = None
+        threshold: float = None,
+        ef_search: Optional[int] = None
     ) -> List[Dict]:
         """
         Perform similarity search on StatPearls embeddings.
 
         Args:
-            query_embedding: Query vector (from clinical note)
+            query_embedding: Query vector (from clinical note), array or list
             top_k: Number of results to return (default from settings)
             threshold: Similarity threshold (default from settings)
+            ef_search: HNSW ef_search for this query (default: server setting)
 
         Returns:
             List of retrieved chunks with metadata and scores
@@ -211,36 +249,44 @@ class SupabaseVectorStore:
             # This assumes you've created a stored procedure in Supabase
             # See create_search_function() method below
 
-            params = {
-                "query_embedding": query_embedding,
-                "match_count": top_k,
-                "similarity_threshold": threshold
-            }
+            if settings.QUANTIZE_QUERY_EMBEDDINGS:
+                # int8 codes are ~4x smaller on the wire; cosine similarity is
+                # scale-invariant, so the server needs only the codes
+                from utils.embeddings import quantize_int8
+                codes, _scale, _zero_point = quantize_int8(query_embedding)
+                rpc_name = "match_statpearls_embeddings_q8"
+                params = {
+                    "query_q8": codes.tolist(),
+                    "match_count": top_k,
+                    "similarity_threshold": threshold
+                }
+            else:
+                rpc_name = "match_statpearls_embeddings"
+                if isinstance(query_embedding, np.ndarray):
+                    # RPC params are JSON; convert once here
+                    query_embedding = query_embedding.tolist()
+                params = {
+                    "query_embedding": query_embedding,
+                    "match_count": top_k,
+                    "similarity_threshold": threshold
+                }
+
+            if ef_search is not None:
+                params["ef_search"] = ef_search
 
             response = self.client.rpc(
-                "match_statpearls_embeddings",
+                rpc_name,
                 params
             ).execute()
 
-            raw_results = response.data if response.data else []
-            logger.info(f"Retrieved {len(raw_results)} StatPearls chunks (raw)")
+            results = response.data if response.data else []
+            logger.info(f"Retrieved {len(results)} StatPearls chunks (raw)")
 
-            # Normalize output: map 'content' to 'text'
-            results = []
-            for row in raw_results:
-                # Temporary debug log for keys
-                logger.error(f"RAW SQL ROW KEYS: {row.keys()}")
-                results.append({
-                    "chunk_id": row.get("chunk_id"),
-                    "text": row.get("content"),
-                    "title": row.get("title"),
-                    "section_type": row.get("section_type"),
-                    "source": row.get("source", "statpearls"),
-                    "similarity_score": row.get("similarity"),  # normalized key
-                    "citation": row.get("citation"),
-                    "license": row.get("license"),
-                    "retracted": row.get("retracted"),
-                })
+            # The search functions already return the final keys (text,
+            # similarity_score); only the pgvector text needs parsing
+            for row in results:
+                row.setdefault("source", "statpearls")
+                row["embedding"] = parse_embedding(row.get("embedding"))
 
             return results
 
@@ -248,6 +294,44 @@ class SupabaseVectorStore:
             logger.error(f"Error during similarity search: {e}")
             return []
     
+    def similarity_search_many(
+        self,
+        query_embeddings: List[Union[np.ndarray, List[float]]],
+        top_k: int = None,
+        threshold: float = None,
+        ef_search: Optional[int] = None
+    ) -> List[List[Dict]]:
+        """
+        Run similarity_search for several queries concurrently.
+        
+        The RPCs are network-bound; a persistent worker pool keeps several in
+        flight over the client's pooled keep-alive connections.
+        
+        Args:
+            query_embeddings: Query vectors
+            top_k: Number of results per query (default from settings)
+            threshold: Similarity threshold (default from settings)
+            ef_search: HNSW ef_search for every query (default: server setting)
+        
+        Returns:
+            One result list per query, in query order
+        """
+        if len(query_embeddings) <= 1:
+            return [
+                self.similarity_search(query_embedding, top_k, threshold, ef_search)
+                for query_embedding in query_embeddings
+            ]
+        
+        if self._search_executor is None:
+            self._search_executor = ThreadPoolExecutor(
+                max_workers=self.SEARCH_WORKERS,
+                thread_name_prefix="pgvector-search"
+            )
+        return list(self._search_executor.map(
+            lambda query_embedding: self.similarity_search(query_embedding, top_k, threshold, ef_search),
+            query_embeddings
+        ))
+    
     def create_search_function(self) -> str:
         """
         SQL function for similarity search.
@@ -263,70 +347,187 @@ class SupabaseVectorStore:
         CREATE OR REPLACE FUNCTION match_statpearls_embeddings(
             query_embedding VECTOR({self.EMBEDDING_DIM}),
             match_count INT DEFAULT 10,
-            similarity_threshold FLOAT DEFAULT 0.7
+            similarity_threshold FLOAT DEFAULT 0.7,
+            ef_search INT DEFAULT NULL
         )
         RETURNS TABLE (
             id UUID,
-            content TEXT,
+            text TEXT,
             title TEXT,
-            license TEXT,
-            citation TEXT,
-            retracted TEXT,
             chunk_id TEXT,
+            section_type TEXT,
             source TEXT,
-            similarity FLOAT
+            similarity_score FLOAT,
+            embedding VECTOR({self.EMBEDDING_DIM})
+        )
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            -- Per-request HNSW search breadth (transaction-local)
+            IF ef_search IS NOT NULL THEN
+                PERFORM set_config('hnsw.ef_search', ef_search::text, true);
+            END IF;
+            
+{self._halfvec_search_query()}
+        END;
+        $$;
+        """
+        
+        logger.info("Similarity search function SQL:")
+        logger.info(search_function_sql)
+        
+        return search_function_sql
+    
+    def create_quantized_search_function(self) -> str:
+        """
+        SQL function for similarity search with int8-quantized queries.
+        
+        Used when settings.QUANTIZE_QUERY_EMBEDDINGS is enabled. The int8
+        codes are cast back to a vector server-side; the per-vector scale is
+        not needed because cosine similarity ignores magnitude.
+        
+        Returns:
+            SQL string for the quantized search function
+        """
+        
+        search_function_sql = f"""
+        CREATE OR REPLACE FUNCTION match_statpearls_embeddings_q8(
+            query_q8 SMALLINT[],
+            match_count INT DEFAULT 10,
+            similarity_threshold FLOAT DEFAULT 0.7,
+            ef_search INT DEFAULT NULL
+        )
+        RETURNS TABLE (
+            id UUID,
+            text TEXT,
+            title TEXT,
             chunk_id TEXT,
             section_type TEXT,
             source TEXT,
-            similarity FLOAT
+            similarity_score FLOAT,
+            embedding VECTOR({self.EMBEDDING_DIM})
         )
         LANGUAGE plpgsql
         AS $$
+        DECLARE
+            -- Unit length again so inner product is cosine similarity
+            query_embedding VECTOR({self.EMBEDDING_DIM}) := l2_normalize(query_q8::real[]::vector);
         BEGIN
-            RETURN QUERY
-            SELECT
-                statpearls_embeddings.id,
-                statpearls_embeddings.content,
-                statpearls_embeddings.title,
-                statpearls_embeddings.chunk_id,
-                statpearls_embeddings.section_type,
-                statpearls_embeddings.source,
-                1 - (statpearls_embeddings.embedding <=> query_embedding) AS similarity
-            FROM statpearls_embeddings
-            WHERE 1 - (statpearls_embeddings.embedding <=> query_embedding) > similarity_threshold
-            ORDER BY statpearls_embeddings.embedding <=> query_embedding
-            LIMIT match_count;
+            -- Per-request HNSW search breadth (transaction-local)
+            IF ef_search IS NOT NULL THEN
+                PERFORM set_config('hnsw.ef_search', ef_search::text, true);
+            END IF;
+            
+{self._halfvec_search_query()}
         END;
         $$;
         """
         
-        logger.info("Similarity search function SQL:")
+        logger.info("Quantized similarity search function SQL:")
         logger.info(search_function_sql)
         
         return search_function_sql
     
+    def _halfvec_search_query(self) -> str:
+        """
+        RETURN QUERY body shared by the search functions.
+        
+        Walks the halfvec HNSW index for candidates, then filters and orders
+        them by exact fp32 similarity. Stored and query embeddings are unit
+        length, so the negative inner product (<#>) is cosine similarity.
+        
+        Returns:
+            PL/pgSQL statement expecting query_embedding, match_count and
+            similarity_threshold in scope
+        """
+        return f"""            RETURN QUERY
+            WITH candidates AS (
+                SELECT statpearls_embeddings.*
+                FROM statpearls_embeddings
+                ORDER BY statpearls_embeddings.embedding::halfvec({self.EMBEDDING_DIM})
+                    <#> query_embedding::halfvec({self.EMBEDDING_DIM})
+                LIMIT GREATEST(match_count, {self.HALFVEC_CANDIDATES})
+            )
+            SELECT
+                candidates.id,
+                candidates.content,
+                candidates.title,
+                candidates.chunk_id,
+                candidates.section_type,
+                candidates.source,
+                -(candidates.embedding <#> query_embedding) AS similarity,
+                candidates.embedding
+            FROM candidates
+            WHERE -(candidates.embedding <#> query_embedding) > similarity_threshold
+            ORDER BY candidates.embedding <#> query_embedding
+            LIMIT match_count;"""
+    
     def get_chunk_by_id(self, chunk_id: str) -> Optional[Dict]:
         """
         Retrieve a specific chunk by its ID.
         
         Phase 10: Evidence Traceability
         
+        Rows are cached for CHUNK_CACHE_TTL_SECONDS, since a report looks up
+        the same few chunks repeatedly.
+        
         Args:
             chunk_id: Unique chunk identifier
         
         Returns:
             Chunk data with metadata
         """
+        return self.get_chunks_by_ids([chunk_id]).get(chunk_id)
+    
+    def get_chunks_by_ids(self, chunk_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Retrieve several chunks in one request.
+        
+        Cached rows are served locally; the rest are fetched with a single
+        chunk_id IN (...) query.
+        
+        Args:
+            chunk_ids: Unique chunk identifiers
+        
+        Returns:
+            Chunk data by chunk_id (IDs that were not found are absent)
+        """
+        found = {}
+        now = time.monotonic()
+        with self._chunk_cache_lock:
+            for chunk_id in chunk_ids:
+                cached = self._chunk_cache.get(chunk_id)
+                if cached is None:
+                    continue
+                if cached[0] <= now:
+                    del self._chunk_cache[chunk_id]
+                    continue
+                self._chunk_cache.move_to_end(chunk_id)
+                found[chunk_id] = dict(cached[1])
+        
+        missing = [chunk_id for chunk_id in dict.fromkeys(chunk_ids) if chunk_id not in found]
+        if not missing:
+            return found
+        
         try:
-            response = self.client.table(self.TABLE_NAME).select("*").eq("chunk_id", chunk_id).execute()
-            
-            if response.data and len(response.data) > 0:
-                return response.data[0]
-            return None
-            
+            response = self.client.table(self.TABLE_NAME).select("*").in_("chunk_id", missing).execute()
         except Exception as e:
-            logger.error(f"Error retrieving chunk {chunk_id}: {e}")
-            return None
+            logger.error(f"Error retrieving chunks {missing}: {e}")
+            return found
+        
+        expires = time.monotonic() + self.CHUNK_CACHE_TTL_SECONDS
+        with self._chunk_cache_lock:
+            for row in response.data or []:
+                chunk_id = row.get("chunk_id")
+                if chunk_id in found:
+                    continue
+                found[chunk_id] = row
+                self._chunk_cache[chunk_id] = (expires, dict(row))
+                self._chunk_cache.move_to_end(chunk_id)
+            while len(self._chunk_cache) > self.CHUNK_CACHE_SIZE:
+                self._chunk_cache.popitem(last=False)
+        
+        return found
     
     def count_embeddings(self) -> int:
         """
@@ -361,6 +562,41 @@ class SupabaseVectorStore:
 
 # ========== HELPER FUNCTIONS ==========
 
+def vector_literal(embedding) -> str:
+    """
+    Format an embedding as a pgvector text literal ("[0.1,0.2,...]").
+    
+    Args:
+        embedding: Embedding vector (list or 1-D array)
+    
+    Returns:
+        Literal suitable for a %s::vector parameter
+    """
+    return '[' + ','.join(map(str, embedding)) + ']'
+
+
+def parse_embedding(value) -> Optional[List[float]]:
+    """
+    Parse a pgvector value returned over PostgREST.
+    
+    pgvector columns arrive as text ("[0.1,0.2,...]"); lists pass through.
+    
+    Args:
+        value: Raw embedding value from an RPC row
+    
+    Returns:
+        Embedding as a list of floats, or None if absent/unparseable
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+    return list(value)
+
+
 def format_retrieval_results(
     raw_results: List[Dict]
 ) -> List[Dict]:
@@ -0,0 +1,183 @@
+"""
+On-disk Embedding Cache
+Memory-mapped store of document embeddings keyed by a digest of the text.
+
+Used for offline re-indexing: chunks whose text has not changed reuse their
+stored vectors instead of running the transformer again.
+
+Files (next to the given path):
+- <path>.f32: raw float32 rows, shape (N, dim), memory-mapped read-only
+- <path>.index.pkl: text digest -> row number, plus model name and dim
+"""
+
+from pathlib import Path
+from typing import List, Tuple
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bump to invalidate existing cache files
+_CACHE_VERSION = 1
+
+
+class EmbeddingFileCache:
+    """
+    Append-only, memory-mapped embedding cache for one embedding model.
+    """
+    
+    def __init__(self, path: str, model_name: str, dim: int = 768):
+        """
+        Open (or start) the cache files at path.
+        
+        Args:
+            path: Base path for the cache files (suffixes are added)
+            model_name: Model the vectors come from; a different model resets the cache
+            dim: Embedding dimension
+        """
+        base = Path(path)
+        self.vectors_path = base.with_name(base.name + '.f32')
+        self.index_path = base.with_name(base.name + '.index.pkl')
+        self.model_name = model_name
+        self.dim = dim
+        self._rows = {}  # text digest -> row
+        self._vectors = None  # np.memmap of shape (len(self._rows), dim)
+        self._lock = threading.Lock()
+        self._load()
+    
+    @staticmethod
+    def key(text: str) -> bytes:
+        """Cache key for a text: 16-byte blake2b digest."""
+        return hashlib.blake2b(text.encode(), digest_size=16).digest()
+    
+    def __len__(self) -> int:
+        return len(self._rows)
+    
+    def _load(self):
+        """Restore the index and map the vectors file; start empty if either is stale."""
+        try:
+            with open(self.index_path, 'rb') as f:
+                cached = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable embedding cache {self.index_path}: {e}")
+            return
+        
+        if (
+            not isinstance(cached, dict)
+            or cached.get('version') != _CACHE_VERSION
+            or cached.get('model') != self.model_name
+            or cached.get('dim') != self.dim
+        ):
+            logger.info(f"Embedding cache {self.index_path} is for another model or version, starting empty")
+            return
+        
+        rows = cached['rows']
+        try:
+            size = self.vectors_path.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        # Rows appended after the last index write are ignored (and truncated on the next add)
+        if size < len(rows) * self.dim * 4:
+            logger.warning(f"Embedding cache {self.vectors_path} is shorter than its index, starting empty")
+            return
+        
+        self._rows = rows
+        self._remap()
+        logger.info(f"Loaded embedding cache with {len(self._rows)} vectors from {self.vectors_path}")
+    
+    def _remap(self):
+        """Memory-map the rows covered by the index."""
+        if self._rows:
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode='r', shape=(len(self._rows), self.dim)
+            )
+        else:
+            self._vectors = None
+    
+    def lookup(self, texts: List[str]) -> Tuple[List[bytes], np.ndarray]:
+        """
+        Find cached rows for texts.
+        
+        Args:
+            texts: Texts to look up
+        
+        Returns:
+            (keys, rows): cache keys per text and int64 row numbers, -1 for misses
+        """
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            rows = np.fromiter((self._rows.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+        return keys, rows
+    
+    def get(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Copy cached vectors out of the memory map.
+        
+        Args:
+            rows: Row numbers from lookup (no misses)
+        
+        Returns:
+            float32 array of shape (len(rows), dim)
+        """
+        if len(rows) == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        with self._lock:
+            return np.asarray(self._vectors[rows])
+    
+    def add(self, keys: List[bytes], vectors: np.ndarray):
+        """
+        Append vectors for new keys and persist the index (best effort).
+        
+        Args:
+            keys: Cache keys, aligned with vectors
+            vectors: float32 array of shape (len(keys), dim)
+        """
+        with self._lock:
+            new_rows = {}
+            for i, key in enumerate(keys):
+                if key not in self._rows and key not in new_rows:
+                    new_rows[key] = i
+            if not new_rows:
+                return
+            
+            block = np.ascontiguousarray(vectors[list(new_rows.values())], dtype=np.float32)
+            start = len(self._rows)
+            # Release the mapping first (Windows cannot resize a mapped file)
+            self._vectors = None
+            try:
+                self.vectors_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.vectors_path, 'ab') as f:
+                    # Drop rows a previous run appended without indexing
+                    f.truncate(start * self.dim * 4)
+                    f.write(block.tobytes())
+            except OSError as e:
+                logger.warning(f"Could not write embedding cache {self.vectors_path}: {e}")
+                self._remap()
+                return
+            
+            for offset, key in enumerate(new_rows):
+                self._rows[key] = start + offset
+            self._remap()
+            self._save_index()
+    
+    def _save_index(self):
+        """Write the index via temp file and rename so readers never see a partial file."""
+        cached = {
+            'version': _CACHE_VERSION,
+            'model': self.model_name,
+            'dim': self.dim,
+            'rows': self._rows,
+        }
+        tmp_path = self.index_path.with_name(f'{self.index_path.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.warning(f"Could not write embedding cache index {self.index_path}: {e}")
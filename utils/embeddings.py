@@ -7,15 +7,108 @@ CRITICAL RULES:
 - No API quotas, works offline
 - Simple, clean embedding calls
 - CPU-safe implementation
+- Embeddings are L2-normalized (pgvector search uses inner product)
 """
 
 from sentence_transformers import SentenceTransformer
-from typing import List
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import hashlib
 import logging
+import os
+import threading
+import numpy as np
+import torch
 from config.settings import settings
+from utils.embedding_cache import EmbeddingFileCache
 
 logger = logging.getLogger(__name__)
 
+# Texts per forward pass in embed_documents (sized for GPU; harmless on CPU)
+_DOCUMENT_BATCH_SIZE = 128
+# Smallest embed_documents input that shows a progress bar (tqdm costs more than tiny encodes)
+_PROGRESS_BAR_MIN_TEXTS = 64
+# Without CUDA, inputs at least this large are spread over a CPU process pool
+_MULTI_PROCESS_MIN_TEXTS = 2048
+# Entries kept in the embed_query LRU
+_QUERY_CACHE_SIZE = 1024
+
+# Loaded models by name, shared by every SentenceTransformerEmbeddings in the process
+_MODELS = {}
+_MODELS_LOCK = threading.Lock()
+
+
+def quantize_int8(vec: List[float]) -> Tuple[np.ndarray, float, int]:
+    """
+    Symmetric scalar quantization of an embedding to int8.
+    
+    Args:
+        vec: Embedding vector
+    
+    Returns:
+        (int8 codes, scale, zero_point) such that vec ~= codes * scale
+    """
+    arr = np.asarray(vec, dtype=np.float32)
+    max_abs = float(np.abs(arr).max()) if arr.size else 0.0
+    scale = max_abs / np.iinfo(np.int8).max if max_abs > 0 else 1.0
+    codes = np.clip(np.rint(arr / scale), -127, 127).astype(np.int8)
+    return codes, scale, 0
+
+
+def dequantize_int8(codes: np.ndarray, scale: float, zero_point: int = 0) -> List[float]:
+    """
+    Reconstruct an embedding from quantize_int8 output.
+    
+    Args:
+        codes: int8 codes
+        scale: Per-vector scale
+        zero_point: Zero point (0 for symmetric quantization)
+    
+    Returns:
+        Approximate embedding vector
+    """
+    return ((codes.astype(np.float32) - zero_point) * scale).tolist()
+
+
+def _load_shared_model(model_name: str) -> SentenceTransformer:
+    """
+    Load a sentence-transformers model once per process.
+    
+    Later embedding services for the same model reuse the loaded weights
+    instead of loading another copy.
+    
+    Args:
+        model_name: Sentence transformers model name
+    
+    Returns:
+        The shared model
+    """
+    with _MODELS_LOCK:
+        model = _MODELS.get(model_name)
+        if model is None:
+            logger.info(f"Loading sentence-transformers model: {model_name}")
+            # Use local cache and increase timeout
+            os.environ['SENTENCE_TRANSFORMERS_HOME'] = os.path.join(os.path.expanduser('~'), '.cache', 'sentence_transformers')
+            model = SentenceTransformer(model_name, cache_folder=None)  # Uses default cache
+            _use_half_precision_on_gpu(model)
+            _MODELS[model_name] = model
+            logger.info(f"Model loaded successfully, no API required")
+        return model
+
+
+def _use_half_precision_on_gpu(model: SentenceTransformer):
+    """
+    Run the model in bf16 (fp16 on pre-Ampere GPUs) when CUDA is available.
+    
+    Halves GPU weight memory and speeds up encoding. CPU inference stays
+    in fp32. Embeddings are upcast to fp32 when converted to numpy.
+    """
+    if not torch.cuda.is_available():
+        return
+    dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    model.to(dtype=dtype)
+    logger.info(f"Sentence transformers model running in {dtype} on GPU")
+
 
 class SentenceTransformerEmbeddings:
     """
@@ -24,49 +117,128 @@ class SentenceTransformerEmbeddings:
     Uses local sentence-transformers model for embeddings (no API required).
     """
     
-    def __init__(self, model_name: str = "sentence-transformers/all-mpnet-base-v2"):
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-mpnet-base-v2",
+        cache_path: Optional[str] = None
+    ):
         """
         Initialize sentence-transformers embeddings.
         
         Args:
             model_name: Sentence transformers model name
+            cache_path: Base path of an on-disk embedding cache for
+                embed_documents (offline re-indexing); None disables it
         """
         self.model_name = model_name
+        self._file_cache = EmbeddingFileCache(cache_path, model_name) if cache_path else None
+        # LRU of query embeddings (float32 arrays) keyed by a digest of the text
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
         try:
-            logger.info(f"Loading sentence-transformers model: {self.model_name}")
-            # Use local cache and increase timeout
-            import os
-            os.environ['SENTENCE_TRANSFORMERS_HOME'] = os.path.join(os.path.expanduser('~'), '.cache', 'sentence_transformers')
-            self.model = SentenceTransformer(self.model_name, cache_folder=None)  # Uses default cache
+            self.model = _load_shared_model(self.model_name)
             logger.info(f"Sentence transformers embeddings initialized with model: {self.model_name}")
-            logger.info(f"Model loaded successfully, no API required")
         except Exception as e:
             logger.error(f"Failed to load sentence-transformers model: {e}")
             logger.warning("Embeddings will not be available. Pipeline may fail for retrieval operations.")
             self.model = None
     
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+    def embed_documents(self, texts: List[str], batch_size: int = _DOCUMENT_BATCH_SIZE) -> np.ndarray:
         """
         Embed documents (StatPearls chunks) using local model.
         
+        Batches stay on the model's device as tensors and are copied to the
+        host once at the end. Large inputs on CPU-only hosts are encoded
+        across a multi-process pool instead. With an on-disk cache, only
+        texts not already cached are encoded.
+        
         Args:
             texts: List of document texts
+            batch_size: Texts per forward pass
         
         Returns:
-            List of embedding vectors
+            float32 array of shape (len(texts), 768), one row per text
         """
         if self.model is None:
             logger.error("Model not loaded. Cannot generate embeddings.")
             # Return zero vectors as fallback
-            return [[0.0] * 768 for _ in texts]
+            return np.zeros((len(texts), 768), dtype=np.float32)
+        if not texts:
+            return np.zeros((0, 768), dtype=np.float32)
+        if self._file_cache is not None:
+            return self._embed_documents_cached(texts, batch_size)
+        return self._encode_documents(texts, batch_size)
+    
+    def _embed_documents_cached(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Serve cached rows from the file cache; encode and append the rest."""
+        keys, rows = self._file_cache.lookup(texts)
+        hits = rows >= 0
+        missing = np.flatnonzero(~hits)
+        
+        embeddings = np.empty((len(texts), self._file_cache.dim), dtype=np.float32)
+        embeddings[hits] = self._file_cache.get(rows[hits])
+        if missing.size:
+            encoded = self._encode_documents([texts[i] for i in missing], batch_size)
+            embeddings[missing] = encoded
+            self._file_cache.add([keys[i] for i in missing], encoded)
+        
+        logger.info(f"Embedding cache: {len(texts) - missing.size} hits, {missing.size} encoded")
+        return embeddings
+    
+    def _encode_documents(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Run the model over texts (device-side batches or the CPU process pool)."""
         logger.info(f"Embedding {len(texts)} documents with sentence-transformers...")
-        embeddings = self.model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
-        return embeddings.tolist()
+        if self._use_multi_process(len(texts)):
+            embeddings = self._encode_multi_process(texts, batch_size)
+            return np.asarray(embeddings, dtype=np.float32)
+        with torch.inference_mode():
+            embeddings = self.model.encode(
+                texts,
+                batch_size=batch_size,
+                show_progress_bar=len(texts) >= _PROGRESS_BAR_MIN_TEXTS,
+                convert_to_tensor=True,
+                normalize_embeddings=True
+            )
+            return embeddings.float().cpu().numpy()
+    
+    def embed_documents_list(self, texts: List[str], batch_size: int = _DOCUMENT_BATCH_SIZE) -> List[List[float]]:
+        """
+        Embed documents as nested lists, for callers that serialize to JSON.
+        
+        Args:
+            texts: List of document texts
+            batch_size: Texts per forward pass
+        
+        Returns:
+            List of embedding vectors
+        """
+        return self.embed_documents(texts, batch_size).tolist()
+    
+    @staticmethod
+    def _use_multi_process(num_texts: int) -> bool:
+        """Whether to encode on a CPU process pool (no CUDA, large input, several cores)."""
+        return (
+            num_texts >= _MULTI_PROCESS_MIN_TEXTS
+            and not torch.cuda.is_available()
+            and (os.cpu_count() or 1) > 1
+        )
+    
+    def _encode_multi_process(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Encode texts on a temporary sentence-transformers CPU process pool."""
+        pool = self.model.start_multi_process_pool()
+        try:
+            return self.model.encode_multi_process(
+                texts, pool, batch_size=batch_size, normalize_embeddings=True
+            )
+        finally:
+            self.model.stop_multi_process_pool(pool)
     
     def embed_query(self, text: str) -> List[float]:
         """
         Embed a query (clinical note) using local model.
         
+        Repeated texts are served from an LRU cache without a forward pass.
+        
         Args:
             text: Query text
         
@@ -77,7 +249,25 @@ class SentenceTransformerEmbeddings:
             logger.error("Model not loaded. Cannot generate query embedding.")
             # Return zero vector as fallback
             return [0.0] * 768
-        embedding = self.model.encode([text], convert_to_numpy=True)
-        return embedding[0].tolist()
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        with self._query_cache_lock:
+            embedding = self._query_cache.get(key)
+            if embedding is not None:
+                self._query_cache.move_to_end(key)
+        if embedding is None:
+            with torch.inference_mode():
+                embedding = self.model.encode(
+                    [text], show_progress_bar=False, convert_to_numpy=True, normalize_embeddings=True
+                )[0]
+            with self._query_cache_lock:
+                self._query_cache[key] = embedding
+                if len(self._query_cache) > _QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+        return embedding.tolist()
+    
+    def cache_clear(self):
+        """Drop all cached query embeddings (e.g. between evaluation runs)."""
+        with self._query_cache_lock:
+            self._query_cache.clear()
 
 
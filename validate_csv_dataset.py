@@ -10,9 +10,9 @@ Tests:
 
 import sys
 import logging
-import random
 from pathlib import Path
 from collections import defaultdict
+import numpy as np
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -38,13 +38,46 @@ class CSVDatasetValidator:
         
         try:
             self.csv_service = DiseaseSymptomCSVService()
+            
+            # Pattern counts as parallel arrays (disease order preserved)
+            disease_patterns = self.csv_service.disease_patterns
+            self._disease_names = np.array(list(disease_patterns), dtype=object)
+            self._pattern_counts = np.fromiter(
+                (len(p) for p in disease_patterns.values()),
+                dtype=np.int64,
+                count=len(disease_patterns)
+            )
+            
             logger.info(f"✅ Loaded {len(self.csv_service.all_diseases)} diseases")
             logger.info(f"✅ Loaded {len(self.csv_service.symptoms)} symptoms")
-            logger.info(f"✅ Loaded {sum(len(p) for p in self.csv_service.disease_patterns.values())} total patterns")
+            logger.info(f"✅ Loaded {int(self._pattern_counts.sum())} total patterns")
+            
+            # generate_diagnoses results by (symptoms, top_k), shared across tests
+            self._dx_cache = {}
         except Exception as e:
             logger.error(f"❌ Failed to load CSV: {e}")
             raise
     
+    def _diagnose(self, symptoms, top_k):
+        """
+        Run csv_service.generate_diagnoses for a symptom list, memoized.
+        
+        Args:
+            symptoms: Symptom strings (order kept in the key)
+            top_k: Number of diagnoses to return
+        
+        Returns:
+            List of diagnosis dicts (a fresh list per call)
+        """
+        key = (tuple(symptoms), top_k)
+        if key not in self._dx_cache:
+            self._dx_cache[key] = self.csv_service.generate_diagnoses(
+                clinical_note=" ".join(symptoms),
+                normalized_data={"symptoms": list(symptoms)},
+                top_k=top_k
+            )
+        return list(self._dx_cache[key])
+    
     def test_1_pattern_diversity(self):
         """Test 1: Pattern diversity per disease."""
         print("\n" + "="*80)
@@ -52,13 +85,11 @@ class CSVDatasetValidator:
         print("="*80)
         print("\nIf this fails → dataset is trash")
         
-        # Count patterns per disease
-        pattern_counts = {}
-        for disease, patterns in self.csv_service.disease_patterns.items():
-            pattern_counts[disease] = len(patterns)
+        pattern_counts = self._pattern_counts
         
-        # Sort by pattern count
-        sorted_diseases = sorted(pattern_counts.items(), key=lambda x: x[1], reverse=True)
+        # Sort by pattern count (descending; stable keeps dataset order for ties)
+        order = np.argsort(-pattern_counts, kind="stable")
+        sorted_diseases = list(zip(self._disease_names[order], pattern_counts[order].tolist()))
         
         # Show top 10 (most patterns)
         print("\n📊 Top 10 Diseases (Most Pattern Diversity):")
@@ -77,10 +108,10 @@ class CSVDatasetValidator:
             print(f"{disease[:48]:<50} {count:>8}")
         
         # Statistics
-        total_patterns = sum(pattern_counts.values())
+        total_patterns = int(pattern_counts.sum())
         avg_patterns = total_patterns / len(pattern_counts)
-        max_patterns = max(pattern_counts.values())
-        min_patterns = min(pattern_counts.values())
+        max_patterns = int(pattern_counts.max())
+        min_patterns = int(pattern_counts.min())
         
         print("\n📈 Statistics:")
         print(f"  Total patterns: {total_patterns:,}")
@@ -128,12 +159,7 @@ class CSVDatasetValidator:
         print(f"   Symptoms: {', '.join(test_case['symptoms'])}")
         
         # Generate diagnoses
-        normalized_data = {"symptoms": test_case['symptoms']}
-        diagnoses = self.csv_service.generate_diagnoses(
-            clinical_note=" ".join(test_case['symptoms']),
-            normalized_data=normalized_data,
-            top_k=10
-        )
+        diagnoses = self._diagnose(test_case['symptoms'], top_k=10)
         
         if not diagnoses:
             print("\n❌ FAIL: No diagnoses generated")
@@ -193,12 +219,7 @@ class CSVDatasetValidator:
         print(f"   {', '.join(full_symptoms)}")
         
         # Generate with full symptoms
-        normalized_data = {"symptoms": full_symptoms}
-        full_diagnoses = self.csv_service.generate_diagnoses(
-            clinical_note=" ".join(full_symptoms),
-            normalized_data=normalized_data,
-            top_k=5
-        )
+        full_diagnoses = self._diagnose(full_symptoms, top_k=5)
         
         if not full_diagnoses:
             print("\n❌ FAIL: No diagnoses with full symptoms")
@@ -214,22 +235,17 @@ class CSVDatasetValidator:
         dropout_rate = 0.35  # 35%
         num_to_remove = int(len(full_symptoms) * dropout_rate)
         
-        dropped_symptoms = full_symptoms.copy()
-        random.seed(42)  # Reproducible
-        for _ in range(num_to_remove):
-            if dropped_symptoms:
-                dropped_symptoms.pop(random.randint(0, len(dropped_symptoms) - 1))
+        # Keep a random subset in original order (seeded local generator: reproducible,
+        # leaves the global random state alone)
+        rng = np.random.default_rng(42)
+        keep = np.sort(rng.choice(len(full_symptoms), size=len(full_symptoms) - num_to_remove, replace=False))
+        dropped_symptoms = [full_symptoms[i] for i in keep]
         
         print(f"\n🔻 Dropped {num_to_remove} symptoms ({dropout_rate*100:.0f}%):")
         print(f"   Remaining: {', '.join(dropped_symptoms)}")
         
         # Generate with dropped symptoms
-        normalized_data_dropped = {"symptoms": dropped_symptoms}
-        dropped_diagnoses = self.csv_service.generate_diagnoses(
-            clinical_note=" ".join(dropped_symptoms),
-            normalized_data=normalized_data_dropped,
-            top_k=5
-        )
+        dropped_diagnoses = self._diagnose(dropped_symptoms, top_k=5)
         
         if not dropped_diagnoses:
             print("\n❌ FAIL: No diagnoses with dropped symptoms")
@@ -241,8 +257,9 @@ class CSVDatasetValidator:
         for i, disease in enumerate(dropped_top_5, 1):
             print(f"   {i}. {disease}")
         
-        # Check overlap
-        overlap = set(full_top_5) & set(dropped_top_5)
+        # Check overlap (kept in dropped-run rank order for the report)
+        full_set = dict.fromkeys(full_top_5)
+        overlap = [d for d in dict.fromkeys(dropped_top_5) if d in full_set]
         overlap_rate = len(overlap) / len(full_top_5) * 100
         
         print(f"\n🔄 Overlap Analysis:")